@@ -0,0 +1,386 @@
+# benchmarks/run.py
+#
+# הרצה מקצה לקצה של האפליקציה מול שרת LLM מקומי ומבחנים סינתטיים.
+# דוגמה:
+#   python -m benchmarks.run --class-sizes 10,50,150 --pages 2 --out bench.json
+#   python -m benchmarks.run --baseline bench.json
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import threading
+import argparse
+import subprocess
+from collections import defaultdict
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.stub_llm import StubConfig, StubServer
+from benchmarks.synthetic_exams import generate_corpus
+
+# יחס איטיות מעליו מדווחת רגרסיה מול baseline
+REGRESSION_THRESHOLD = 1.2
+
+
+class SpanCollector(logging.Handler):
+    # אוסף את ה־spans שנרשמים בלוג המובנה של האפליקציה
+
+    def __init__(self):
+        super().__init__()
+        self.durations = defaultdict(list)
+        self.intervals = defaultdict(list)  # stage -> [(start, end)] בשעון time.time()
+
+    def emit(self, record: logging.LogRecord):
+        fields = getattr(record, "fields", {})
+        if record.getMessage() == "span" and "stage" in fields:
+            self.durations[fields["stage"]].append(fields["duration_ms"])
+            self.intervals[fields["stage"]].append((record.created - fields["duration_ms"] / 1000, record.created))
+
+    def reset(self) -> tuple:
+        spans = (self.durations, self.intervals)
+        self.durations, self.intervals = defaultdict(list), defaultdict(list)
+        return spans
+
+
+class MemorySampler:
+    # דוגם ב־thread את ה־RSS הנוכחי של התהליך ושל כל הצאצאים שלו (מאגר החילוץ)
+    # מתוך /proc. ru_maxrss לא מתאים: הוא שיא של כל חיי התהליך, ו־RUSAGE_CHILDREN
+    # סופר רק תהליכים שכבר הסתיימו. שרת ה־LLM המדומה רץ ב־thread ונספר ב־self.
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.available = os.path.exists(f"/proc/{os.getpid()}/statm")
+        self.page_size = os.sysconf("SC_PAGE_SIZE") if self.available else 0
+        self.samples = []  # (time, self_bytes, {pid: bytes})
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def __enter__(self):
+        if self.available:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _rss(self, pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/statm", "rb") as f:
+                return int(f.read().split()[1]) * self.page_size
+        except (OSError, IndexError, ValueError):
+            return 0  # התהליך הסתיים בין הסריקה לקריאה
+
+    def _descendants(self, root: int) -> list:
+        children = defaultdict(list)
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "rb") as f:
+                    # השדה אחרי "(comm)" הוא state ואחריו ppid
+                    ppid = int(f.read().rsplit(b")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children[ppid].append(int(entry))
+        found, stack = [], [root]
+        while stack:
+            for child in children.pop(stack.pop(), []):
+                found.append(child)
+                stack.append(child)
+        return found
+
+    def _run(self):
+        pid = os.getpid()
+        while not self._stop.is_set():
+            sample = (time.time(), self._rss(pid), {child: self._rss(child) for child in self._descendants(pid)})
+            with self._lock:
+                self.samples.append(sample)
+            self._stop.wait(self.interval)
+
+    def reset(self) -> list:
+        with self._lock:
+            samples, self.samples = self.samples, []
+        return samples
+
+
+def peak_rss_mb(samples: list) -> dict:
+    # שיא של הסכום בכל רגע (ולא סכום השיאים), בנפרד לתהליך הראשי ולצאצאים
+    if not samples:
+        return {"self": None, "children": None, "total": None, "processes": 0}
+    mb = 1024 * 1024
+    return {
+        "self": round(max(own for _, own, _ in samples) / mb, 1),
+        "children": round(max(sum(children.values()) for _, _, children in samples) / mb, 1),
+        "total": round(max(own + sum(children.values()) for _, own, children in samples) / mb, 1),
+        "processes": max(len(children) for _, _, children in samples) + 1,
+    }
+
+
+def stage_report(spans: tuple, samples: list, slack: float) -> dict:
+    # שלב קצר ממרווח הדגימה מקבל את הדגימות שסביבו (slack שניות לכל צד)
+    durations, intervals = spans
+    report = {}
+    for stage, values in durations.items():
+        in_stage = [
+            sample for sample in samples
+            if any(start - slack <= sample[0] <= end + slack for start, end in intervals[stage])
+        ]
+        report[stage] = {**summarize(values), "peak_rss_mb": peak_rss_mb(in_stage)}
+    return report
+
+
+def summarize(samples_ms: list) -> dict:
+    if not samples_ms:
+        return {"count": 0}
+    values = np.asarray(samples_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "total_ms": round(float(values.sum()), 2),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def create_project(client, solution_path, test_paths, project_type, num_questions, poll_interval=0.05):
+    files = [("test_files", (os.path.basename(p), open(p, "rb"), "application/pdf")) for p in test_paths]
+    files.append(("solution_file", ("solution.pdf", open(solution_path, "rb"), "application/pdf")))
+    data = {
+        "project_name": "bench",
+        "subject": "Physics",
+        "num_questions": num_questions,
+        "num_tests": len(test_paths),
+        "project_type": project_type,
+    }
+
+    start = time.perf_counter()
+    try:
+        response = client.post("/projects/create", data=data, files=files)
+    finally:
+        for _, (_, handle, _) in files:
+            handle.close()
+    accepted = time.perf_counter()
+    if response.status_code != 202:
+        raise RuntimeError(f"create failed: {response.status_code} {response.text}")
+
+    job_id = response.json()["job_id"]
+    while True:
+        job = client.get(f"/projects/jobs/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(poll_interval)
+    finished = time.perf_counter()
+
+    return {
+        "status": job["status"],
+        "error": job.get("error"),
+        "accept_ms": round((accepted - start) * 1000, 2),
+        "end_to_end_ms": round((finished - start) * 1000, 2),
+        "students_per_second": round(len(test_paths) / (finished - start), 2),
+    }
+
+
+def bench_create(client, collector, sampler, workdir, args) -> list:
+    scenarios = []
+    for size in args.class_sizes:
+        for repeat in range(args.repeats):
+            corpus_dir = os.path.join(workdir, "corpus", f"{size}_{repeat}")
+            solution, tests = generate_corpus(
+                corpus_dir, size, args.questions, args.pages, args.project_type, seed=size * 1000 + repeat
+            )
+            # cold: קבצים חדשים; warm: אותם קבצים שוב, כדי למדוד את המטמון
+            for mode in ("cold", "warm"):
+                collector.reset()
+                sampler.reset()
+                run = create_project(client, solution, tests, args.project_type, args.questions)
+                samples = sampler.reset()
+                scenarios.append({
+                    "benchmark": "create_project",
+                    "class_size": size,
+                    "pages_per_exam": args.pages,
+                    "repeat": repeat,
+                    "mode": mode,
+                    **run,
+                    "stages": stage_report(collector.reset(), samples, sampler.interval),
+                    "peak_rss_mb": peak_rss_mb(samples),
+                })
+                print(f"🔹 create size={size} repeat={repeat} {mode}: {run['end_to_end_ms']} ms ({run['status']})")
+    return scenarios
+
+
+def bench_list(client, collector, sampler, args) -> list:
+    from services import catalog
+
+    scenarios = []
+    seeded = 0
+    for count in args.project_counts:
+        for index in range(seeded, count):
+            meta = {
+                "name": f"synthetic {index}",
+                "subject": f"subject {index % 20}",
+                "project_type": ("open", "multichoice", "homework")[index % 3],
+                "num_questions": 10,
+                "num_tests": 100,
+            }
+            stats = {"average": float(50 + index % 50)}
+            catalog.upsert_project(f"synthetic-{index}", f"synthetic_{index}", meta, "graded", stats=stats)
+        seeded = max(seeded, count)
+
+        collector.reset()
+        sampler.reset()
+        samples = []
+        for _ in range(args.list_requests):
+            start = time.perf_counter()
+            response = client.get("/projects/", params={"limit": 50, "sort": "average"})
+            samples.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+        memory = sampler.reset()
+
+        scenarios.append({
+            "benchmark": "list_projects",
+            "num_projects": count,
+            "latency": summarize(samples),
+            "requests_per_second": round(len(samples) / (sum(samples) / 1000), 2),
+            "stages": stage_report(collector.reset(), memory, sampler.interval),
+            "peak_rss_mb": peak_rss_mb(memory),
+        })
+        print(f"🔹 list projects={count}: p50 {scenarios[-1]['latency']['p50_ms']} ms")
+    return scenarios
+
+
+def _scenario_key(scenario: dict) -> tuple:
+    return tuple(
+        scenario.get(k) for k in ("benchmark", "class_size", "pages_per_exam", "repeat", "mode", "num_projects")
+    )
+
+
+def _headline_ms(scenario: dict) -> float:
+    if scenario["benchmark"] == "create_project":
+        return scenario["end_to_end_ms"]
+    return scenario["latency"]["p50_ms"]
+
+
+def compare(current: dict, baseline: dict) -> int:
+    previous = {_scenario_key(s): s for s in baseline["scenarios"]}
+    regressions = 0
+    print(f"\nComparing {current['commit']} against {baseline['commit']}")
+    for scenario in current["scenarios"]:
+        old = previous.get(_scenario_key(scenario))
+        if old is None:
+            continue
+        ratio = _headline_ms(scenario) / max(_headline_ms(old), 1e-9)
+        flag = "❌ REGRESSION" if ratio > REGRESSION_THRESHOLD else ""
+        regressions += bool(flag)
+        print(f"  {_scenario_key(scenario)}: {_headline_ms(old):.1f} -> {_headline_ms(scenario):.1f} ms (x{ratio:.2f}) {flag}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="CheckMate offline benchmark")
+    parser.add_argument("--class-sizes", type=lambda v: [int(x) for x in v.split(",")], default=[10, 50, 150])
+    parser.add_argument("--project-counts", type=lambda v: [int(x) for x in v.split(",")], default=[100, 1000, 5000])
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--project-type", default="open", choices=["open", "multichoice", "homework"])
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--list-requests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--latency-per-student", type=float, default=0.02)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--fence-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--tokens-per-minute", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rss-interval", type=float, default=0.02, help="seconds between RSS samples")
+    parser.add_argument("--out", default=None, help="JSON results path")
+    parser.add_argument("--baseline", default=None, help="previous results JSON to compare against")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix="checkmate-bench-")
+    out_path = os.path.abspath(
+        args.out or os.path.join(REPO_ROOT, "benchmarks", "results", f"{git_commit()}_{int(time.time())}.json")
+    )
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    stub_config = StubConfig(
+        latency=args.latency,
+        latency_per_student=args.latency_per_student,
+        truncate_rate=args.truncate_rate,
+        malformed_rate=args.malformed_rate,
+        fence_rate=args.fence_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        tokens_per_minute=args.tokens_per_minute,
+    )
+
+    with StubServer(stub_config, port=args.port) as stub:
+        # ההגדרות נקראות בזמן import, לכן נקבעות לפני טעינת האפליקציה
+        os.environ.update({
+            "OPENAI_BASE_URL": stub.base_url,
+            "OPENAI_API_KEY": "stub",
+            "GRADING_RETRY_BASE_DELAY": "0.05",
+            "CACHE_DIR": os.path.join(workdir, "data", "cache"),
+            "JOBS_DB": os.path.join(workdir, "data", "jobs.db"),
+            "CATALOG_DB": os.path.join(workdir, "data", "catalog.db"),
+        })
+        os.chdir(workdir)
+
+        from fastapi.testclient import TestClient
+        from main import app
+
+        collector = SpanCollector()
+        app_logger = logging.getLogger("checkmate")
+        for handler in app_logger.handlers:
+            handler.setLevel(logging.WARNING)
+        app_logger.addHandler(collector)
+
+        with TestClient(app) as client, MemorySampler(args.rss_interval) as sampler:
+            scenarios = bench_create(client, collector, sampler, workdir, args)
+            scenarios += bench_list(client, collector, sampler, args)
+
+        llm_calls = stub.calls
+        llm_rate_limited = stub.rate_limited
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "llm_calls": llm_calls,
+        "llm_rate_limited": llm_rate_limited,
+        "scenarios": scenarios,
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {out_path}")
+
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# benchmarks/stub_llm.py
+#
+# שרת מקומי תואם OpenAI (POST /v1/chat/completions) שמחזיר ציונים מזויפים,
+# עם השהיה, חיתוך ופלט שבור בהסתברות שניתנת להגדרה.
+
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+@dataclass
+class StubConfig:
+    latency: float = 0.5            # שניות לכל בקשה
+    latency_per_student: float = 0.05
+    jitter: float = 0.2             # חלק יחסי מההשהיה
+    truncate_rate: float = 0.0      # פלט שנחתך באמצע (כמו max_tokens)
+    malformed_rate: float = 0.0     # פלט שאינו JSON בכלל
+    fence_rate: float = 0.0         # JSON עטוף ב־```json
+    rate_limit_rate: float = 0.0    # תשובת 429
+    tokens_per_minute: int = 0      # מכסת טוקנים בחלון של דקה, עם כותרות x-ratelimit-* כמו אצל OpenAI
+    seed: int = 0
+
+
+def create_app(config: StubConfig) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(config.seed)
+    app.state.calls = 0
+    app.state.rate_limited = 0
+    window = deque()  # (זמן, טוקנים) של הבקשות שהתקבלו בדקה האחרונה
+
+    def token_window(tokens: int):
+        now = time.monotonic()
+        while window and window[0][0] <= now - 60:
+            window.popleft()
+        used = sum(count for _, count in window)
+        allowed = used + tokens <= config.tokens_per_minute or not window
+        if allowed:
+            window.append((now, tokens))
+            used += tokens
+        reset = max(0.0, window[0][0] + 60 - now)
+        headers = {
+            "x-ratelimit-limit-tokens": str(config.tokens_per_minute),
+            "x-ratelimit-remaining-tokens": str(max(0, config.tokens_per_minute - used)),
+            "x-ratelimit-reset-tokens": f"{reset:.3f}s",
+        }
+        return allowed, headers
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        prompt = body["messages"][-1]["content"]
+        students = re.findall(r"^STUDENT: (.+)$", prompt, re.MULTILINE)
+        match = re.search(r"Number of questions: (\d+)", prompt)
+        num_questions = int(match.group(1)) if match else 1
+
+        headers = {}
+        if config.tokens_per_minute:
+            allowed, headers = token_window(len(prompt) // 4 + body.get("max_tokens", 0))
+            if not allowed:
+                app.state.rate_limited += 1
+                return JSONResponse(
+                    status_code=429,
+                    headers={**headers, "retry-after-ms": str(int(float(headers["x-ratelimit-reset-tokens"][:-1]) * 1000))},
+                    content={"error": {"message": "Rate limit reached for tokens", "type": "tokens"}},
+                )
+
+        delay = config.latency + config.latency_per_student * len(students)
+        await asyncio.sleep(max(0.0, delay * (1 + rng.uniform(-config.jitter, config.jitter))))
+
+        if rng.random() < config.rate_limit_rate:
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": "1"},
+                content={"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+            )
+
+        records = []
+        for student in students:
+            grades = [
+                {"question_number": q + 1, "grade": rng.randint(40, 100)}
+                for q in range(num_questions)
+            ]
+            overall = round(sum(g["grade"] for g in grades) / max(len(grades), 1))
+            records.append({"student": student, "grades": grades, "overall_score": overall})
+        content = json.dumps(records)
+
+        roll = rng.random()
+        if roll < config.malformed_rate:
+            content = "Sorry, I cannot grade these exams."
+        elif roll < config.malformed_rate + config.truncate_rate:
+            content = content[: rng.randint(len(content) // 3, len(content) - 1)]
+        if rng.random() < config.fence_rate:
+            content = f"```json\n{content}\n```"
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return JSONResponse(headers=headers, content={
+            "id": f"chatcmpl-stub-{app.state.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "length" if roll < config.malformed_rate + config.truncate_rate else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    return app
+
+
+class StubServer:
+    def __init__(self, config: StubConfig, host: str = "127.0.0.1", port: int = 8765):
+        self.app = create_app(config)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        self.base_url = f"http://{host}:{port}/v1"
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+    @property
+    def calls(self) -> int:
+        return self.app.state.calls
+
+    @property
+    def rate_limited(self) -> int:
+        return self.app.state.rate_limited
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub grader")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--latency-per-student", type=float, default=0.05)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--fence-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--tokens-per-minute", type=int, default=0)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency,
+        latency_per_student=args.latency_per_student,
+        truncate_rate=args.truncate_rate,
+        malformed_rate=args.malformed_rate,
+        fence_rate=args.fence_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        tokens_per_minute=args.tokens_per_minute,
+    )
+    uvicorn.run(create_app(config), host="127.0.0.1", port=args.port)
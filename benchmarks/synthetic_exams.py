@@ -0,0 +1,72 @@
+# benchmarks/synthetic_exams.py
+
+import os
+import random
+
+import fitz  # PyMuPDF
+
+CHOICES = "ABCD"
+FILLER = (
+    "The student explains the reasoning step by step, writes the relevant formula, "
+    "substitutes the given values and arrives at a final answer with units."
+)
+
+
+def _write_pdf(path: str, pages: list[list[str]]):
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        y = 60
+        for line in lines:
+            page.insert_text((50, y), line, fontsize=10)
+            y += 14
+    doc.save(path)
+    doc.close()
+
+
+def _exam_pages(header: str, body_lines: list[str], pages: int) -> list[list[str]]:
+    per_page = max(1, len(body_lines) // pages + 1)
+    result = []
+    for page_number in range(pages):
+        chunk = body_lines[page_number * per_page:(page_number + 1) * per_page]
+        result.append([header, ""] + chunk + ["", f"Page {page_number + 1} of {pages}"])
+    return result
+
+
+def generate_corpus(
+    out_dir: str,
+    num_students: int,
+    num_questions: int = 10,
+    pages_per_exam: int = 2,
+    project_type: str = "open",
+    seed: int = 0,
+) -> tuple[str, list[str]]:
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    header = "Physics 101 - Midterm exam - Spring semester"
+
+    key = [rng.choice(CHOICES) for _ in range(num_questions)]
+    if project_type == "multichoice":
+        solution_lines = [f"{q + 1}. {answer}" for q, answer in enumerate(key)]
+    else:
+        solution_lines = [f"Question {q + 1}: {FILLER}" for q in range(num_questions)]
+    solution_path = os.path.join(out_dir, "solution.pdf")
+    _write_pdf(solution_path, _exam_pages(header, solution_lines, 1))
+
+    test_paths = []
+    for student in range(num_students):
+        if project_type == "multichoice":
+            lines = [
+                f"{q + 1}. {answer if rng.random() < 0.7 else rng.choice(CHOICES)}"
+                for q, answer in enumerate(key)
+            ]
+        else:
+            lines = []
+            for q in range(num_questions):
+                lines.append(f"Question {q + 1}:")
+                lines.extend([FILLER[: rng.randint(40, len(FILLER))]] * rng.randint(1, 4))
+        path = os.path.join(out_dir, f"student_{student + 1:04d}.pdf")
+        _write_pdf(path, _exam_pages(header, lines, pages_per_exam))
+        test_paths.append(path)
+
+    return solution_path, test_paths
@@ -1,18 +1,135 @@
 # main.py
 
-from fastapi import FastAPI
+import os
+import sys
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+# לפני כל import שקורא הגדרות מהסביבה
+load_dotenv()
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from routers import projects
+from services.job_queue import register_handler, start_workers, stop_workers
+from services.pdf_extraction import shutdown_pool, warm_pool
+from services.cache import grading_cache, text_cache
+from services.catalog import init_catalog
+from services.admission import admission_control, admission_stats
+from services.uploads import limit_request_size
+from utils.db import close_all_connections
+from utils.metrics import (
+    REQUEST_SECONDS,
+    configure_logging,
+    finish_request_timing,
+    log_event,
+    render_metrics,
+    start_request_timing,
+)
+
+configure_logging()
+
+# ספריות כבדות (openai, numpy, PyMuPDF) לא נטענות ב־import של האפליקציה;
+# הן נטענות ברקע אחרי העלייה, ו־/ready מחזיר 200 רק כשהן מוכנות
+register_handler("create_project", "services.grading_service:run_grading_job")
+register_handler("regrade_project", "services.grading_service:run_regrade_job")
+
+
+async def _warm_grading():
+    def load():
+        from services import grading_service  # noqa: F401  openai, numpy, tiktoken
+        from services.grader_backends import GRADING_MODEL, default_backend
+        from prompt_builder.compaction import count_tokens
+
+        count_tokens("", GRADING_MODEL)
+        backend = default_backend()
+        # לקוח ה־HTTP של ה־backend נוצר פעם אחת ומשותף לכל העבודות
+        getattr(backend, "client", None)
+
+    await asyncio.to_thread(load)
+
+
+async def warm_up(app: FastAPI):
+    start = time.perf_counter()
+    for stage, step in (("grading", _warm_grading), ("extraction", warm_pool)):
+        try:
+            await step()
+        except Exception as e:
+            # ההכנה המוקדמת היא אופטימיזציה בלבד; כשל כאן יופיע שוב בבקשה הראשונה
+            log_event("warm_up_failed", logging.WARNING, stage=stage, error=str(e))
+    app.state.ready = True
+    log_event("ready", duration_ms=round((time.perf_counter() - start) * 1000, 2))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from services.project_service import PROJECTS_DIR, import_existing_projects
+
+    app.state.ready = False
+    os.makedirs(PROJECTS_DIR, exist_ok=True)
+    init_catalog()
+    await asyncio.to_thread(import_existing_projects)
+    # תור עבודות הבדיקה רץ ברקע באותו תהליך
+    start_workers()
+    warm_up_task = asyncio.create_task(warm_up(app))
+    try:
+        yield
+    finally:
+        warm_up_task.cancel()
+        await stop_workers()
+        if "services.grader_backends" in sys.modules:
+            from services.grader_backends import close_backends
+            await close_backends()
+        shutdown_pool()
+        close_all_connections()
 
-app = FastAPI()
 
-# CORS – תקשורת עם ה-Frontend
+app = FastAPI(lifespan=lifespan)
+
+# בקרת כניסה לפי תקציב עבודות וטוקנים (429 + Retry-After), אחרי בדיקת הגודל
+app.middleware("http")(admission_control)
+
+# דחיית בקשות גדולות מדי לפני קריאת הגוף
+app.middleware("http")(limit_request_size)
+
+
+# מדידת זמן לכל בקשה + כותרת Server-Timing עם השלבים שנמדדו בתוכה
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    token = start_request_timing()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        server_timing = finish_request_timing(token)
+    duration = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    path = route.path if route else request.url.path
+    REQUEST_SECONDS.observe(duration, method=request.method, path=path, status=response.status_code)
+    total = f"total;dur={duration * 1000:.1f}"
+    response.headers["Server-Timing"] = f"{server_timing}, {total}" if server_timing else total
+    log_event(
+        "request", method=request.method, path=path,
+        status=response.status_code, duration_ms=round(duration * 1000, 2),
+    )
+    return response
+
+
+# CORS – תקשורת עם ה-Frontend. נרשם אחרון כדי שיהיה החיצוני ביותר:
+# גם תשובות 413/429 של ה־middlewares למעלה צריכות כותרות CORS
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # אפשר להחליף לדומיין ספציפי בפרודקשן
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Total-Count", "Server-Timing"],
 )
 
 # חיבור הנתיבים
@@ -22,3 +139,32 @@ app.include_router(projects.router, prefix="/projects", tags=["Projects"])
 @app.get("/")
 def root():
     return {"status": "✅ CheckMate backend is running"}
+
+
+@app.get("/ready")
+def ready():
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming up"})
+    return {"status": "ready"}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "extracted_text": text_cache.stats(),
+        "grading": grading_cache.stats(),
+    }
+
+
+@app.get("/admission/stats")
+def admission_stats_route():
+    stats = admission_stats()
+    if "services.grader_backends" in sys.modules:
+        from services.grader_backends import throttle_stats
+        stats["providers"] = throttle_stats()
+    return stats
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,12 @@
+from pydantic import BaseModel, Field
+
+
+class QuestionGrade(BaseModel):
+    question_number: int
+    grade: int | float = Field(ge=0)
+
+
+class StudentResult(BaseModel):
+    student: str
+    grades: list[QuestionGrade]
+    overall_score: int | float = Field(ge=0)
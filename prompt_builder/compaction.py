@@ -0,0 +1,212 @@
+import re
+from collections import Counter
+from functools import lru_cache
+
+# חלוקה שמרנית כשאין tokenizer: טקסט בעברית מתפרק ליותר טוקנים מאנגלית
+CHARS_PER_TOKEN = 3
+# מפריד בין עמודים בטקסט שחולץ מ־PDF
+PAGE_BREAK = "\f"
+
+# מספר עמוד עם סימון מפורש: "Page 3", "3 of 5", "עמוד 3 מתוך 5", "- 3 -"
+MARKED_PAGE_NUMBER = re.compile(
+    r"^(?:(?:page|עמוד|עמ'?)\s*\d+(?:\s*(?:of|/|מתוך)\s*\d+)?|\d+\s*(?:of|מתוך)\s*\d+|-\s*\d+\s*-)$",
+    re.IGNORECASE,
+)
+# מספר או שבר בלבד - יכול להיות גם תשובה של תלמיד, ולכן נמחק רק כשהוא ממספר את העמודים
+BARE_PAGE_NUMBER = re.compile(r"^(\d+)(?:\s*/\s*\d+)?$")
+# כמה שורות בתחילת ובסוף כל עמוד נחשבות לכותרת / כותרת תחתונה
+PAGE_EDGE_LINES = 2
+QUESTION_HEADER = re.compile(
+    r"^\s*(?:(?:question|q|שאלה)\s*(?:no\.?|#|מס'?)?\s*(\d+)|(\d+)\s*[.)]\s)",
+    re.IGNORECASE,
+)
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # לרוב אין גישה לרשת להורדת קובץ ה־encoding
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4") -> str:
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    return encoding.decode(tokens[:max_tokens])
+
+
+def _normalize_lines(text: str) -> list[str]:
+    return [re.sub(r"[ \t\u00a0]+", " ", line).strip() for line in text.splitlines()]
+
+
+def _edge_indexes(lines: list[str], edge_lines: int) -> list[int]:
+    filled = [index for index, line in enumerate(lines) if line]
+    return filled[:edge_lines] + filled[max(edge_lines, len(filled) - edge_lines):]
+
+
+def _strip_page_numbers(pages: list[list[str]], edge_lines: int = PAGE_EDGE_LINES) -> list[list[str]]:
+    # מספר עמוד נמחק רק בקצה העמוד: עם סימון מפורש, או מספר/שבר בלבד שממספר
+    # לפחות שני עמודים ברצף (המספר פחות מיקום העמוד זהה). "42" או "3/4" בגוף
+    # התשובה, או בקצה של עמוד שלא ממוספר כך, נשארים.
+    drop = [set() for _ in pages]
+    bare = []
+    numbered_pages = {}  # offset -> עמודים שממוספרים לפיו
+    for page_index, lines in enumerate(pages):
+        for index in _edge_indexes(lines, edge_lines):
+            line = lines[index]
+            number = re.search(r"\d+", line)
+            if MARKED_PAGE_NUMBER.match(line):
+                drop[page_index].add(index)
+            elif BARE_PAGE_NUMBER.match(line):
+                bare.append((page_index, index, int(number.group()) - page_index))
+            else:
+                continue
+            numbered_pages.setdefault(int(number.group()) - page_index, set()).add(page_index)
+
+    for page_index, index, offset in bare:
+        if len(numbered_pages[offset]) >= 2:
+            drop[page_index].add(index)
+
+    return [
+        [line for index, line in enumerate(lines) if index not in dropped]
+        for lines, dropped in zip(pages, drop)
+    ]
+
+
+def _join_lines(lines: list[str]) -> str:
+    text = []
+    for line in lines:
+        if not line and (not text or not text[-1]):
+            continue
+        text.append(line)
+    return "\n".join(text).strip()
+
+
+def normalize_pages(text: str) -> list[str]:
+    # הטקסט המחולץ מפריד בין עמודים ב־PAGE_BREAK; טקסט ישן בלי מפריד הוא עמוד אחד
+    pages = _strip_page_numbers([_normalize_lines(page) for page in text.split(PAGE_BREAK)])
+    return [_join_lines(lines) for lines in pages]
+
+
+def normalize_text(text: str) -> str:
+    return _join_lines("\n".join(normalize_pages(text)).split("\n"))
+
+
+def _classify_lines(pages: list[str], edge_lines: int):
+    # לכל שורה: (שורה, בקצה העמוד?, בתוך שאלה?) וגם השורות שחוזרות בקצוות של כמה עמודים
+    occurrences = []
+    edge_counts = Counter()
+    in_question = False
+    for page in pages:
+        lines = [line for line in page.splitlines() if line]
+        edges = set(range(min(edge_lines, len(lines)))) | set(range(max(0, len(lines) - edge_lines), len(lines)))
+        for index, line in enumerate(lines):
+            if QUESTION_HEADER.match(line + " "):
+                in_question = True
+            at_edge = index in edges
+            occurrences.append((line, at_edge, in_question))
+        edge_counts.update({lines[index] for index in edges})
+    running = {line for line, count in edge_counts.items() if count >= 2}
+    return occurrences, running
+
+
+def strip_shared_boilerplate(
+    documents: list[list[str]],
+    template_text: str = "",
+    min_share: float = 0.8,
+    min_documents: int = 3,
+    min_line_length: int = 12,
+    edge_lines: int = PAGE_EDGE_LINES,
+):
+    # מוחק רק boilerplate של עמודים שחוזר כמעט בכל המבחנים:
+    #   לפני השאלה הראשונה - שורה בקצה עמוד, או שורה שמופיעה גם בפתרון / בתבנית המבחן;
+    #   בתוך השאלות - רק כותרת/כותרת תחתונה רצה (בקצה של שני עמודים לפחות באותו מבחן).
+    # תשובה שרוב הכיתה כתבה באותה צורה לעולם לא נמחקת.
+    # documents: לכל מבחן רשימת העמודים שלו (אחרי normalize_text)
+    texts = ["\n".join(pages) for pages in documents]
+    if len(documents) < min_documents:
+        return texts, []
+
+    template = {line for line in normalize_text(template_text).splitlines() if line}
+    classified = []
+    document_frequency = Counter()
+    for pages in documents:
+        occurrences, running = _classify_lines(pages, edge_lines)
+        removable = [
+            len(line) >= min_line_length
+            and not QUESTION_HEADER.match(line + " ")
+            and ((not in_question and (at_edge or line in template)) or (at_edge and line in running))
+            for line, at_edge, in_question in occurrences
+        ]
+        classified.append((occurrences, removable))
+        document_frequency.update({line for (line, _, _), remove in zip(occurrences, removable) if remove})
+
+    threshold = max(2, int(len(documents) * min_share))
+    boilerplate = {line for line, count in document_frequency.items() if count >= threshold}
+    if not boilerplate:
+        return texts, []
+
+    cleaned = [
+        "\n".join(
+            line for (line, _, _), remove in zip(occurrences, removable)
+            if not (remove and line in boilerplate)
+        )
+        for occurrences, removable in classified
+    ]
+    return cleaned, sorted(boilerplate)
+
+
+def compact_student_texts(student_texts: list[tuple[str, str]], template_text: str = ""):
+    filenames = [filename for filename, _ in student_texts]
+    documents = [normalize_pages(text) for _, text in student_texts]
+    texts, boilerplate = strip_shared_boilerplate(documents, template_text)
+    return list(zip(filenames, texts)), boilerplate
+
+
+def split_solution_by_question(solution_text: str) -> dict[int, str]:
+    sections = {}
+    preamble = []
+    current = None
+    for line in solution_text.splitlines():
+        match = QUESTION_HEADER.match(line)
+        if match:
+            current = int(match.group(1) or match.group(2))
+            sections.setdefault(current, [])
+        if current is None:
+            preamble.append(line)
+        else:
+            sections[current].append(line)
+
+    # פחות משתי שאלות מזוהות - כנראה שהפורמט לא מתאים לחלוקה
+    if len(sections) < 2:
+        return {}
+    result = {number: "\n".join(lines).strip() for number, lines in sections.items()}
+    if any(line.strip() for line in preamble):
+        result[0] = "\n".join(preamble).strip()
+    return result
+
+
+def select_solution(solution_text: str, question_numbers: list[int]) -> str:
+    sections = split_solution_by_question(solution_text)
+    if not sections:
+        return solution_text
+    selected = [sections[0]] if 0 in sections else []
+    selected += [sections[n] for n in sorted(question_numbers) if n in sections]
+    return "\n\n".join(selected)
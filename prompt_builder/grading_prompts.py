@@ -1,85 +1,93 @@
-def build_open_test_prompt(subject, num_questions, solution_text, expected_average, student_texts):
-    prompt = f"""
-You are an intelligent and objective exam grader. The exam type is: OPEN QUESTIONS.
-
-Subject: {subject}
-Number of questions: {num_questions}
-
-Reference solution:
-{solution_text if solution_text else '[NO SOLUTION GIVEN — use your own knowledge]'}
-
-Grade the following student exams. Each answer should be graded from 0 to 100.
-Adjust grading (if needed) so that the average score is approximately (10%) {expected_average if expected_average else 'natural'}.
+# ההוראות הקבועות נמצאות בתחילת הפרומפט ואינן תלויות בפרויקט,
+# כך שה־prefix זהה בין בקשות ו־prompt caching של הספק יכול לפעול.
 
+OUTPUT_FORMAT = """
 Return for each student:
-[{{
+[{
   "student": "filename",
-  "grades": [{{ "question_number": int, "grade": int }}],
+  "grades": [{ "question_number": int, "grade": int }],
   "overall_score": grade
-}}]
+}]
 Only output valid JSON format.
 """
 
-    student_blocks = "\n".join([
-        f"STUDENT: {filename}\n{text}" for filename, text in student_texts
-    ])
-
-    return prompt + "\n\n" + student_blocks
+OPEN_TEST_INSTRUCTIONS = """
+You are an intelligent and objective exam grader. The exam type is: OPEN QUESTIONS.
 
+Grade the following student exams. Each answer should be graded from 0 to 100.
+Adjust grading (if needed) so that the average score is approximately (10%) the target average given below.
+""" + OUTPUT_FORMAT
 
-def build_multichoice_prompt(subject, num_questions, solution_text, expected_average, student_texts):
-    prompt = f"""
+MULTICHOICE_INSTRUCTIONS = """
 You are a strict grader for multiple choice exams.
 
-Subject: {subject}
-Number of questions: {num_questions}
-
-Correct answers:
-{solution_text if solution_text else '[NO ANSWER KEY PROVIDED — use best guess]'}
-
-Each question is worth 100 / num_questions points. Mark answers as correct (1) or incorrect (0).
-Adjust the scores to target an average of (10%) {expected_average if expected_average else 'natural'}.
-
-Return for each student:
-[{{
-  "student": "filename",
-  "grades": [{{ "question_number": int, "grade": int }}],
-  "overall_score": grade
-}}]
-Only output valid JSON format.
-"""
-
-    student_blocks = "\n".join([
-        f"STUDENT: {filename}\n{text}" for filename, text in student_texts
-    ])
+Grade each question 100 if the answer is correct and 0 if it is incorrect or missing.
+Adjust the scores to target an average of (10%) the target average given below.
+""" + OUTPUT_FORMAT
 
-    return prompt + "\n\n" + student_blocks
+HOMEWORK_INSTRUCTIONS = """
+You are a fair grader for homework assignments.
 
+Each question should be graded from 0 to 100, fairly, but with less strictness than in exams.
+Adjust grades to have a target average of (10%) the target average given below.
+""" + OUTPUT_FORMAT
 
-def build_homework_prompt(subject, num_questions, solution_text, expected_average, student_texts):
-    prompt = f"""
-You are a fair grader for homework assignments.
 
+def _project_block(
+    subject, num_questions, solution_label, solution_text, missing_solution, expected_average,
+    question_numbers=None,
+):
+    block = f"""
 Subject: {subject}
 Number of questions: {num_questions}
-
-Reference solution:
-{solution_text if solution_text else '[NO SOLUTION GIVEN — use your own knowledge]'}
-
-Each question should be graded fairly, but with less strictness than in exams.
-Adjust grades to have a target average of (10%) {expected_average if expected_average else 'natural'}.
-
-Return for each student:
-[{{
-  "student": "filename",
-  "grades": [{{ "question_number": int, "grade": int }}],
-  "overall_score": grade
-}}]
-Only output valid JSON format.
+Target average: {expected_average if expected_average else 'natural'}
+"""
+    if question_numbers:
+        # בדיקה חוזרת של חלק מהשאלות - השאר כבר נבדקו ואין לבדוק אותן שוב
+        listed = ", ".join(str(q) for q in question_numbers)
+        block += f"""Grade ONLY questions: {listed}
+Return grades only for these question numbers and ignore all other questions in the student answers.
+"""
+    return block + f"""
+{solution_label}
+{solution_text if solution_text else missing_solution}
 """
 
-    student_blocks = "\n".join([
+
+def _student_blocks(student_texts):
+    return "\n".join([
         f"STUDENT: {filename}\n{text}" for filename, text in student_texts
     ])
 
-    return prompt + "\n\n" + student_blocks
+
+def build_open_test_prompt(
+    subject, num_questions, solution_text, expected_average, student_texts, question_numbers=None,
+):
+    prompt = OPEN_TEST_INSTRUCTIONS + _project_block(
+        subject, num_questions, "Reference solution:", solution_text,
+        "[NO SOLUTION GIVEN — use your own knowledge]", expected_average,
+        question_numbers,
+    )
+    return prompt + "\n\n" + _student_blocks(student_texts)
+
+
+def build_multichoice_prompt(
+    subject, num_questions, solution_text, expected_average, student_texts, question_numbers=None,
+):
+    prompt = MULTICHOICE_INSTRUCTIONS + _project_block(
+        subject, num_questions, "Correct answers:", solution_text,
+        "[NO ANSWER KEY PROVIDED — use best guess]", expected_average,
+        question_numbers,
+    )
+    return prompt + "\n\n" + _student_blocks(student_texts)
+
+
+def build_homework_prompt(
+    subject, num_questions, solution_text, expected_average, student_texts, question_numbers=None,
+):
+    prompt = HOMEWORK_INSTRUCTIONS + _project_block(
+        subject, num_questions, "Reference solution:", solution_text,
+        "[NO SOLUTION GIVEN — use your own knowledge]", expected_average,
+        question_numbers,
+    )
+    return prompt + "\n\n" + _student_blocks(student_texts)
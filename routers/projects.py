@@ -1,16 +1,21 @@
 # routers/projects.py
 
-from fastapi import APIRouter, File, UploadFile, Form
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, File, UploadFile, Form, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List, Optional
+import asyncio
+import json
 import uuid
-from services.grading_service import handle_project_creation
+from services.job_queue import TERMINAL_STATUSES, get_job
+from services.catalog import SORTABLE_COLUMNS
+from services.admission import client_id
 from models.project import ProjectCreateRequest
 
 router = APIRouter()
 
 @router.post("/create")
 async def create_project_route(
+    request: Request,
     project_name: str = Form(...),
     subject: str = Form(...),
     num_questions: int = Form(...),
@@ -20,6 +25,7 @@ async def create_project_route(
     solution_file: Optional[UploadFile] = File(None),
     test_files: List[UploadFile] = File(...)
 ):
+    from services.grading_service import handle_project_creation
     project_id = str(uuid.uuid4())
 
     return await handle_project_creation(
@@ -31,11 +37,117 @@ async def create_project_route(
         project_type=project_type,
         expected_average=expected_average,
         solution_file=solution_file,
-        test_files=test_files
+        test_files=test_files,
+        client_id=client_id(request),
     )
 
 
+@router.post("/{project_id}/tests")
+async def add_tests_route(
+    project_id: str,
+    request: Request,
+    test_files: List[UploadFile] = File(...)
+):
+    # קובץ בשם של מבחן קיים מחליף אותו; רק מה שהשתנה נבדק
+    from services.grading_service import handle_add_tests
+    return await handle_add_tests(project_id, test_files, client_id(request))
+
+
+@router.post("/{project_id}/regrade")
+async def regrade_route(
+    project_id: str,
+    request: Request,
+    students: Optional[List[str]] = Form(None),
+    questions: Optional[List[int]] = Form(None),
+    solution_file: Optional[UploadFile] = File(None)
+):
+    from services.grading_service import handle_regrade
+    return await handle_regrade(project_id, students, questions, solution_file, client_id(request))
+
+
 @router.get("/")
-def list_projects():
+def list_projects(
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    subject: Optional[str] = None,
+    project_type: Optional[str] = None,
+    sort: str = Query("created_at", enum=list(SORTABLE_COLUMNS)),
+    order: str = Query("desc", enum=["asc", "desc"]),
+):
     from services.project_service import get_all_projects
-    return get_all_projects()
+    projects, total = get_all_projects(offset, limit, subject, project_type, sort, order)
+    response.headers["X-Total-Count"] = str(total)
+    return projects
+
+
+@router.get("/{project_id}/results")
+def get_results_route(
+    project_id: str,
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    format: Optional[str] = Query(None, enum=["json", "ndjson"]),
+):
+    from services.project_service import find_project_path
+    from services.result_store import count_results, iter_result_lines
+    project_path = find_project_path(project_id)
+    if project_path is None:
+        return JSONResponse(status_code=404, content={"error": "Project not found"})
+
+    headers = {"X-Total-Count": str(count_results(project_path))}
+    # השורות נשלחות כפי שהן שמורות בדיסק, בלי פענוח וקידוד מחדש
+    if format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", ""):
+        lines = (line + b"\n" for line in iter_result_lines(project_path, offset, limit))
+        return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+
+    page = b",".join(iter_result_lines(project_path, offset, limit or 100))
+    return Response(b"[" + page + b"]", media_type="application/json", headers=headers)
+
+
+@router.get("/{project_id}/grades")
+def get_grades_route(project_id: str):
+    import numpy as np
+    import orjson
+    from services.project_service import find_project_path
+    from services.result_store import load_grades
+    project_path = find_project_path(project_id)
+    if project_path is None:
+        return JSONResponse(status_code=404, content={"error": "Project not found"})
+
+    # מטריצת ציונים תלמידים×שאלות; null כשאין ציון
+    students, question_numbers, grades = load_grades(project_path)
+    body = orjson.dumps(
+        {"students": students, "question_numbers": question_numbers, "grades": np.asarray(grades)},
+        option=orjson.OPT_SERIALIZE_NUMPY,
+    )
+    return Response(body, media_type="application/json")
+
+
+@router.get("/jobs/{job_id}")
+def get_job_route(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    job.pop("payload")
+    return job
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events_route(job_id: str):
+    if get_job(job_id) is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+
+    async def event_stream():
+        last_update = None
+        while True:
+            job = await asyncio.to_thread(get_job, job_id)
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                job.pop("payload")
+                yield f"event: {job['status']}\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
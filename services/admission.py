@@ -0,0 +1,173 @@
+# services/admission.py
+#
+# בקרת כניסה לפני צינור הבדיקה: תקציב גלובלי ותקציב לכל לקוח של עבודות פעילות
+# (בתור או בריצה, כולל העלאות שעוד לא הסתיימו) ושל טוקנים מוערכים.
+# בקשה שחורגת נדחית ב־429 עם Retry-After, עוד לפני שגוף ההעלאה נקרא.
+#
+# זיהוי הלקוח - רק ממקור שאי אפשר לזייף מבחוץ:
+#   1. X-Client-Key שמופיע ב־ADMISSION_CLIENT_KEYS ("tenant=key,...") -> שם ה־tenant
+#   2. בקשה שהגיעה מ־proxy שמופיע ב־ADMISSION_TRUSTED_PROXIES (כתובות / CIDR, מופרדות בפסיק):
+#      X-Client-Id שה־proxy קבע, ואחרת הכתובת הראשונה מימין ב־X-Forwarded-For שאינה proxy מוכר
+#   3. אחרת כתובת ה־IP של החיבור עצמו; X-Client-Id ו־X-Forwarded-For מתעלמים מהם,
+#      כי לקוח יכול לשנות אותם בכל בקשה ולעקוף את התקציב שלו.
+# מאחורי reverse proxy חובה להגדיר את ADMISSION_TRUSTED_PROXIES, אחרת כל הלקוחות
+# נספרים כלקוח אחד (כתובת ה־proxy).
+
+import os
+import re
+import hmac
+import math
+import asyncio
+import ipaddress
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from services.job_queue import JOB_WORKERS, active_usage, recent_job_seconds
+from utils.metrics import ADMISSION_REJECTED, log_event
+
+MAX_ACTIVE_JOBS = int(os.getenv("ADMISSION_MAX_JOBS", "32"))
+MAX_ACTIVE_JOBS_PER_CLIENT = int(os.getenv("ADMISSION_MAX_JOBS_PER_CLIENT", "4"))
+MAX_ACTIVE_TOKENS = int(os.getenv("ADMISSION_MAX_TOKENS", "20000000"))
+MAX_ACTIVE_TOKENS_PER_CLIENT = int(os.getenv("ADMISSION_MAX_TOKENS_PER_CLIENT", "5000000"))
+# הערכה גסה לטקסט שיוצא מ־PDF ביחס לגודל הקובץ; הטקסט האמיתי ידוע רק אחרי החילוץ
+BYTES_PER_TOKEN = int(os.getenv("ADMISSION_BYTES_PER_TOKEN", "100"))
+DEFAULT_JOB_SECONDS = float(os.getenv("ADMISSION_DEFAULT_JOB_SECONDS", "60"))
+MAX_RETRY_AFTER = int(os.getenv("ADMISSION_MAX_RETRY_AFTER", "600"))
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(entry.strip(), strict=False)
+    for entry in os.getenv("ADMISSION_TRUSTED_PROXIES", "").split(",") if entry.strip()
+]
+CLIENT_KEYS = dict(
+    reversed(entry.strip().split("=", 1))
+    for entry in os.getenv("ADMISSION_CLIENT_KEYS", "").split(",") if "=" in entry
+)  # key -> tenant
+
+# יצירת פרויקט, הוספת מבחנים ובדיקה חוזרת - כל מה שמכניס עבודה לתור
+ADMITTED_PATHS = re.compile(r"^/projects/(?:create|[^/]+/(?:tests|regrade))/?$")
+
+# בקשות שעברו את הבדיקה ועוד לא הכניסו עבודה לתור: client_id -> [עבודות, טוקנים]
+_reserved: Dict[str, List[int]] = {}
+_lock = threading.Lock()
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_id(request: Request) -> str:
+    key = request.headers.get("x-client-key", "")
+    if key:
+        for known_key, tenant in CLIENT_KEYS.items():
+            if hmac.compare_digest(key, known_key):
+                return f"key:{tenant}"
+
+    peer = request.client.host if request.client else "unknown"
+    if not _is_trusted_proxy(peer):
+        return peer
+
+    header = request.headers.get("x-client-id", "").strip()
+    if header:
+        return f"id:{header[:128]}"
+    forwarded = [part.strip() for part in request.headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    for address in reversed(forwarded):
+        if not _is_trusted_proxy(address):
+            return address
+    return peer
+
+
+def estimate_tokens(num_bytes: int) -> int:
+    return num_bytes // BYTES_PER_TOKEN
+
+
+def _retry_after(jobs_to_finish: int) -> int:
+    per_job = recent_job_seconds() or DEFAULT_JOB_SECONDS
+    seconds = math.ceil(per_job * max(1, jobs_to_finish) / max(1, JOB_WORKERS))
+    return max(1, min(MAX_RETRY_AFTER, seconds))
+
+
+def _check(client: str, tokens: int) -> Optional[Tuple[str, int]]:
+    usage = active_usage()
+    for name, (jobs, reserved_tokens) in _reserved.items():
+        active_jobs, active_tokens = usage.get(name, (0, 0))
+        usage[name] = (active_jobs + jobs, active_tokens + reserved_tokens)
+    total_jobs = sum(jobs for jobs, _ in usage.values())
+    total_tokens = sum(tokens for _, tokens in usage.values())
+    client_jobs, client_tokens = usage.get(client, (0, 0))
+
+    # עבודה שגדולה מכל התקציב לבדה מתקבלת כשאין עבודות אחרות, אחרת לא הייתה מתקבלת לעולם
+    if client_jobs >= MAX_ACTIVE_JOBS_PER_CLIENT:
+        return "client_jobs", _retry_after(client_jobs - MAX_ACTIVE_JOBS_PER_CLIENT + 1)
+    if client_tokens and client_tokens + tokens > MAX_ACTIVE_TOKENS_PER_CLIENT:
+        return "client_tokens", _retry_after(1)
+    if total_jobs >= MAX_ACTIVE_JOBS:
+        return "jobs", _retry_after(total_jobs - MAX_ACTIVE_JOBS + 1)
+    if total_tokens and total_tokens + tokens > MAX_ACTIVE_TOKENS:
+        return "tokens", _retry_after(1)
+    return None
+
+
+def try_admit(client: str, tokens: int) -> Optional[Tuple[str, int]]:
+    # מחזיר (סיבה, שניות להמתנה) כשהבקשה נדחית; אחרת שומר לה מקום עד release()
+    with _lock:
+        rejection = _check(client, tokens)
+        if rejection is None:
+            reserved = _reserved.setdefault(client, [0, 0])
+            reserved[0] += 1
+            reserved[1] += tokens
+        return rejection
+
+
+def release(client: str, tokens: int):
+    with _lock:
+        reserved = _reserved[client]
+        reserved[0] -= 1
+        reserved[1] -= tokens
+        if reserved[0] == 0:
+            del _reserved[client]
+
+
+def admission_stats() -> dict:
+    with _lock:
+        reserved = {name: {"jobs": jobs, "tokens": tokens} for name, (jobs, tokens) in _reserved.items()}
+    return {
+        "limits": {
+            "jobs": MAX_ACTIVE_JOBS,
+            "jobs_per_client": MAX_ACTIVE_JOBS_PER_CLIENT,
+            "tokens": MAX_ACTIVE_TOKENS,
+            "tokens_per_client": MAX_ACTIVE_TOKENS_PER_CLIENT,
+        },
+        "active": {name: {"jobs": jobs, "tokens": tokens} for name, (jobs, tokens) in active_usage().items()},
+        "uploading": reserved,
+    }
+
+
+async def admission_control(request: Request, call_next):
+    if request.method != "POST" or not ADMITTED_PATHS.match(request.url.path):
+        return await call_next(request)
+
+    client = client_id(request)
+    content_length = request.headers.get("content-length", "")
+    tokens = estimate_tokens(int(content_length)) if content_length.isdigit() else 0
+    rejection = await asyncio.to_thread(try_admit, client, tokens)
+    if rejection is not None:
+        reason, retry_after = rejection
+        ADMISSION_REJECTED.inc(reason=reason)
+        log_event("admission_rejected", client=client, reason=reason, retry_after=retry_after)
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(retry_after)},
+            content={"error": "Too many grading requests", "reason": reason, "retry_after": retry_after},
+        )
+
+    # המקום שמור עד שהעבודה נכנסה לתור (או שהבקשה נכשלה) ונספרת מה־DB
+    try:
+        return await call_next(request)
+    finally:
+        release(client, tokens)
@@ -0,0 +1,167 @@
+# services/answer_sheets.py
+#
+# זיהוי תשובות במבחנים אמריקאיים ישירות מה־PDF, בלי LLM.
+# השורות נבנות מחדש לפי מיקום המילים בעמוד, כך שגם טבלת תשובות שבה המספר
+# והתשובה נמצאים בתאים נפרדים נקראת כשורה אחת ("3 B").
+
+import re
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from services.cache import hash_file, hash_key, text_cache
+from services.pdf_extraction import DEFAULT_TIMEOUT, ExtractionPoolError, run_in_pool
+from utils.metrics import ERRORS, log_event
+
+ANSWER_PATTERN = re.compile(
+    r"(?<![\w.,])(?:q|question|שאלה)?\s*(\d{1,3})\s*(?:[.):\-]\s*|\s+)([A-Ea-eא-ה])(?!\w)",
+    re.IGNORECASE,
+)
+# מה שמותר שיופיע בשורת תשובות מלבד התשובות עצמן ("Answers: 1 A 2 B")
+ANSWER_LINE_LABEL = re.compile(r"\b(?:answers?|key|sheet|תשובות|תשובה)\b", re.IGNORECASE)
+HEBREW_CHOICES = {"א": "A", "ב": "B", "ג": "C", "ד": "D", "ה": "E"}
+CHOICE_CODES = {choice: code for code, choice in enumerate("ABCDE", start=1)}
+HEBREW_LETTER = re.compile(r"[א-ת]")
+
+
+@dataclass
+class AnswerSheet:
+    answers: Dict[int, str] = field(default_factory=dict)
+    # שאלות שזוהו בהן כמה תשובות שונות
+    conflicts: Set[int] = field(default_factory=set)
+
+    def confidence(self, questions: List[int]) -> float:
+        if not questions:
+            return 0.0
+        return sum(1 for q in questions if q in self.answers) / len(questions)
+
+    def covers(self, questions: List[int]) -> bool:
+        # כל שאלה זוהתה עם תשובה אחת בדיוק (שאלה עם סימון סותר לא נמצאת ב־answers)
+        return bool(questions) and all(q in self.answers for q in questions)
+
+    def report(self, questions: List[int]) -> dict:
+        return {
+            "answers": {str(q): a for q, a in sorted(self.answers.items())},
+            "conflicts": sorted(self.conflicts),
+            "confidence": round(self.confidence(questions), 3),
+        }
+
+
+def _is_answer_line(line: str) -> bool:
+    # רק שורה שכולה תשובות נקראת; נוסח שאלה ("3. A 2 kg mass slides") או
+    # כותרת ("Class 10 B") משאירים מילים או מספרים אחרי הסרת התשובות
+    rest = ANSWER_LINE_LABEL.sub("", ANSWER_PATTERN.sub("", line))
+    return not re.search(r"[^\W_]", rest)
+
+
+def parse_answer_text(text: str) -> AnswerSheet:
+    sheet = AnswerSheet()
+    for line in text.splitlines():
+        if not _is_answer_line(line):
+            continue
+        for number, choice in ANSWER_PATTERN.findall(line):
+            question = int(number)
+            choice = HEBREW_CHOICES.get(choice, choice.upper())
+            if question in sheet.conflicts:
+                continue
+            previous = sheet.answers.setdefault(question, choice)
+            if previous != choice:
+                del sheet.answers[question]
+                sheet.conflicts.add(question)
+    return sheet
+
+
+def score_answer_sheets(key: AnswerSheet, sheets: List[AnswerSheet], questions: List[int]) -> np.ndarray:
+    # מטריצה תלמידים×שאלות של קודי תשובה (0 = אין תשובה) והשוואה אחת מול המפתח
+    # המפתח חייב לכסות את כל השאלות; שאלה בלי מפתח הייתה מקבלת 0 אצל כולם
+    missing = [q for q in questions if q not in key.answers]
+    if missing:
+        raise ValueError(f"Answer key is missing questions: {missing}")
+    key_codes = np.array([CHOICE_CODES.get(key.answers.get(q), 0) for q in questions], dtype=np.int8)
+    answers = np.array(
+        [[CHOICE_CODES.get(sheet.answers.get(q), 0) for q in questions] for sheet in sheets],
+        dtype=np.int8,
+    ).reshape(len(sheets), len(questions))
+    correct = (answers == key_codes) & (key_codes > 0)
+    return correct.astype(np.int16) * 100
+
+
+# 🔹 פונקציה שרצה בתהליכי העבודה
+
+def _read_layout_text(path: str, max_pages: Optional[int] = None) -> str:
+    import fitz  # PyMuPDF
+
+    rows = []
+    with fitz.open(path) as doc:
+        for index, page in enumerate(doc):
+            if max_pages and index >= max_pages:
+                break
+            words = sorted(page.get_text("words"), key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+            current, current_y, current_h = [], None, 0.0
+            for x0, y0, x1, y1, word, *_ in words:
+                y = (y0 + y1) / 2
+                # מילים באותו גובה (בחצי גובה שורה) שייכות לאותה שורה, גם מבלוקים שונים
+                if current and abs(y - current_y) > max(current_h, y1 - y0) / 2:
+                    rows.append(_join_row(current))
+                    current = []
+                if not current:
+                    current_y, current_h = y, y1 - y0
+                current.append((x0, word))
+            if current:
+                rows.append(_join_row(current))
+    return "\n".join(rows)
+
+
+def _join_row(words: List[Tuple[float, str]]) -> str:
+    words.sort()
+    if any(HEBREW_LETTER.search(word) for _, word in words):
+        # שורה בעברית נקראת מימין לשמאל
+        words.reverse()
+    return " ".join(word for _, word in words)
+
+
+# 🔹 ממשק אסינכרוני
+
+async def read_layout_text(
+    path: str,
+    content_hash: Optional[str] = None,
+    max_pages: Optional[int] = None,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+) -> str:
+    try:
+        if content_hash is None:
+            content_hash = await asyncio.to_thread(hash_file, path)
+        cache_key = hash_key("answer_layout", content_hash, max_pages)
+        cached = await asyncio.to_thread(text_cache.get, cache_key)
+        if cached is not None:
+            return cached
+        text = await asyncio.wait_for(run_in_pool(_read_layout_text, path, max_pages), timeout)
+    except ExtractionPoolError:
+        raise
+    except asyncio.TimeoutError:
+        # כמו ב־extract_pdf: מסמך שנתקע לא עוצר את כל העבודה, והתלמיד יעבור ל־LLM
+        log_event("answer_sheet_failed", logging.WARNING, path=path, error="timeout")
+        ERRORS.inc(stage="read_answer_sheets")
+        return ""
+    except Exception as e:
+        # קובץ שלא נקרא פשוט לא יזוהה, והתלמיד יעבור ל־LLM
+        log_event("answer_sheet_failed", logging.WARNING, path=path, error=str(e))
+        ERRORS.inc(stage="read_answer_sheets")
+        return ""
+    await asyncio.to_thread(text_cache.set, cache_key, text)
+    return text
+
+
+async def read_layout_texts(
+    paths: List[str],
+    content_hashes: Optional[List[Optional[str]]] = None,
+    max_pages: Optional[int] = None,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+) -> List[str]:
+    content_hashes = content_hashes or [None] * len(paths)
+    return await asyncio.gather(
+        *(read_layout_text(path, h, max_pages, timeout) for path, h in zip(paths, content_hashes))
+    )
@@ -0,0 +1,118 @@
+# services/cache.py
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Optional
+
+from utils.db import SQLiteConnections
+from utils.metrics import CACHE_HITS, CACHE_MISSES
+
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join("data", "cache"))
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+GRADING_CACHE_MAX_BYTES = int(os.getenv("GRADING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_key(*parts: Any) -> str:
+    return hash_bytes(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+
+
+class DiskCache:
+    # מטמון על הדיסק עם פינוי LRU לפי גודל; SQLite מטפל בגישה מכמה תהליכים במקביל
+
+    def __init__(self, name: str, max_bytes: int):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.path = os.path.join(CACHE_DIR, f"{name}.db")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connect = SQLiteConnections(self.path, setup=self._setup)
+
+    def _setup(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        (CACHE_HITS if hit else CACHE_MISSES).inc(cache=self.name)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(False)
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count(True)
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, data, len(data), time.time()),
+                )
+                self._evict(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+text_cache = DiskCache("extracted_text", TEXT_CACHE_MAX_BYTES)
+grading_cache = DiskCache("grading", GRADING_CACHE_MAX_BYTES)
@@ -0,0 +1,162 @@
+# services/catalog.py
+
+import os
+import json
+import time
+import sqlite3
+from typing import Optional
+
+from utils.db import SQLiteConnections
+
+CATALOG_DB = os.getenv("CATALOG_DB", os.path.join("data", "catalog.db"))
+
+SORTABLE_COLUMNS = ("created_at", "updated_at", "name", "subject", "num_tests", "average")
+
+
+_connect = SQLiteConnections(CATALOG_DB, row_factory=sqlite3.Row)
+
+
+def init_catalog():
+    with _connect() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS projects (
+                project_id TEXT PRIMARY KEY,
+                folder TEXT NOT NULL,
+                name TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                project_type TEXT,
+                num_questions INTEGER,
+                num_tests INTEGER,
+                expected_average INTEGER,
+                status TEXT NOT NULL,
+                average REAL,
+                stats TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS projects_subject ON projects (subject, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS projects_type ON projects (project_type, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS projects_created ON projects (created_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS catalog_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+
+def upsert_project(
+    project_id: str,
+    folder: str,
+    meta: dict,
+    status: str,
+    stats: Optional[dict] = None,
+    num_tests: Optional[int] = None,
+    created_at: Optional[float] = None,
+):
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            """
+            INSERT INTO projects (
+                project_id, folder, name, subject, project_type, num_questions, num_tests,
+                expected_average, status, average, stats, created_at, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (project_id) DO UPDATE SET
+                folder = excluded.folder,
+                name = excluded.name,
+                subject = excluded.subject,
+                project_type = excluded.project_type,
+                num_questions = excluded.num_questions,
+                num_tests = excluded.num_tests,
+                expected_average = excluded.expected_average,
+                status = excluded.status,
+                average = COALESCE(excluded.average, projects.average),
+                stats = COALESCE(excluded.stats, projects.stats),
+                updated_at = excluded.updated_at
+            """,
+            (
+                project_id,
+                folder,
+                meta["name"],
+                meta["subject"],
+                meta.get("project_type"),
+                meta.get("num_questions"),
+                num_tests if num_tests is not None else meta.get("num_tests"),
+                meta.get("expected_average"),
+                status,
+                stats["average"] if stats else None,
+                json.dumps(stats, ensure_ascii=False) if stats else None,
+                created_at or now,
+                now,
+            ),
+        )
+
+
+def set_status(project_id: str, status: str):
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE projects SET status = ?, updated_at = ? WHERE project_id = ?",
+            (status, time.time(), project_id),
+        )
+
+
+def get_project(project_id: str) -> Optional[dict]:
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM projects WHERE project_id = ?", (project_id,)).fetchone()
+    return _row_to_project(row) if row else None
+
+
+def _row_to_project(row: sqlite3.Row) -> dict:
+    return {
+        "project_id": row["project_id"],
+        "folder": row["folder"],
+        "project_name": row["name"],
+        "subject": row["subject"],
+        "project_type": row["project_type"],
+        "num_questions": row["num_questions"],
+        "num_tests": row["num_tests"],
+        "expected_average": row["expected_average"],
+        "status": row["status"],
+        "stats": json.loads(row["stats"]) if row["stats"] else None,
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def list_projects(
+    offset: int = 0,
+    limit: int = 50,
+    subject: Optional[str] = None,
+    project_type: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+) -> tuple[list[dict], int]:
+    if sort not in SORTABLE_COLUMNS:
+        raise ValueError(f"Invalid sort column: {sort}")
+    direction = "ASC" if order.lower() == "asc" else "DESC"
+
+    filters = []
+    params = []
+    if subject:
+        filters.append("subject = ?")
+        params.append(subject)
+    if project_type:
+        filters.append("project_type = ?")
+        params.append(project_type)
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+
+    with _connect() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM projects {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT * FROM projects {where} ORDER BY {sort} {direction}, project_id LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
+    return [_row_to_project(row) for row in rows], total
+
+
+def get_flag(key: str) -> Optional[str]:
+    with _connect() as conn:
+        row = conn.execute("SELECT value FROM catalog_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_flag(key: str, value: str):
+    with _connect() as conn:
+        conn.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES (?, ?)", (key, value))
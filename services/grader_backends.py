@@ -0,0 +1,343 @@
+# services/grader_backends.py
+
+import os
+import asyncio
+import random
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+
+from services.answer_sheets import parse_answer_text, score_answer_sheets
+from services.response_parser import parse_grading_output
+from services.throttle import AdaptiveThrottle
+from utils.metrics import (
+    COMPLETION_TOKENS,
+    ERRORS,
+    LLM_CALLS,
+    LLM_RATE_LIMITED,
+    LLM_RETRIES,
+    LLM_THROTTLE_SECONDS,
+    PROMPT_TOKENS,
+    log_event,
+    span,
+)
+from prompt_builder.compaction import count_tokens, select_solution
+from prompt_builder.grading_prompts import (
+    build_open_test_prompt,
+    build_multichoice_prompt,
+    build_homework_prompt,
+)
+
+GRADING_MODEL = os.getenv("GRADING_MODEL", "gpt-4")
+GRADING_TEMPERATURE = float(os.getenv("GRADING_TEMPERATURE", "0.0"))
+MAX_CONCURRENCY = int(os.getenv("GRADING_MAX_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("GRADING_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("GRADING_RETRY_BASE_DELAY", "1.0"))
+CONTEXT_TOKENS = int(os.getenv("GRADING_CONTEXT_TOKENS", "8192"))
+MAX_OUTPUT_TOKENS = int(os.getenv("GRADING_MAX_OUTPUT_TOKENS", "4000"))
+
+# "openai" או "openai_compatible" (שרת מקומי כמו vLLM / Ollama / llama.cpp)
+GRADER_BACKEND = os.getenv("GRADER_BACKEND", "openai")
+GRADER_BASE_URL = os.getenv("GRADER_BASE_URL", "http://localhost:8000/v1")
+GRADER_API_KEY = os.getenv("GRADER_API_KEY", "not-needed")
+# "rule_based" בודק אמריקאיות מול מפתח התשובות, בלי LLM
+MULTICHOICE_BACKEND = os.getenv("MULTICHOICE_BACKEND", "rule_based")
+
+PROMPT_BUILDERS = {
+    "open": build_open_test_prompt,
+    "multichoice": build_multichoice_prompt,
+    "homework": build_homework_prompt,
+}
+
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+# callback שנקרא עם רשומות שנבדקו, עוד לפני שכל המנה הסתיימה
+RecordsCallback = Callable[[Dict[str, dict]], Awaitable[None]]
+
+
+class GradingError(Exception):
+    pass
+
+
+def build_prompt(
+    project_type, subject, num_questions, solution_text, expected_average, student_texts,
+    question_numbers=None,
+):
+    builder = PROMPT_BUILDERS.get(project_type)
+    if builder is None:
+        raise ValueError(f"Invalid project_type: {project_type}")
+    if question_numbers:
+        # רק החלק הרלוונטי מהפתרון נשלח כשבודקים תת־קבוצה של שאלות
+        solution_text = select_solution(solution_text, question_numbers)
+    return builder(subject, num_questions, solution_text, expected_average, student_texts, question_numbers)
+
+
+@dataclass
+class GradingContext:
+    project_type: str
+    subject: str
+    num_questions: int
+    solution_text: str
+    expected_average: Optional[int]
+    question_numbers: Optional[List[int]] = None
+    # טקסט לפי מיקום (services.answer_sheets) עבור הבודק הדטרמיניסטי
+    answer_key_text: Optional[str] = None
+    answer_sheets: Dict[str, str] = field(default_factory=dict)
+    prompts: List[str] = field(default_factory=list)
+
+    @property
+    def questions(self) -> List[int]:
+        return self.question_numbers or list(range(1, self.num_questions + 1))
+
+    def render(self, student_texts: List[Tuple[str, str]]) -> str:
+        return build_prompt(
+            self.project_type, self.subject, self.num_questions, self.solution_text,
+            self.expected_average, student_texts, self.question_numbers,
+        )
+
+
+class GraderBackend:
+    name = "base"
+    model = "none"
+    temperature = 0.0
+    # backends שתומכים בכך מקבלים כמה תלמידים בבקשה אחת, לפי תקציב טוקנים
+    supports_batching = False
+    # backend מקומי, בלי מגבלת context, מקבל את כל התלמידים במנה אחת
+    local = False
+    cacheable = False
+    max_concurrency = MAX_CONCURRENCY
+    context_tokens = CONTEXT_TOKENS
+    max_output_tokens = MAX_OUTPUT_TOKENS
+
+    async def grade_batch(
+        self,
+        batch: List[Tuple[str, str]],
+        context: GradingContext,
+        on_records: Optional[RecordsCallback] = None,
+    ) -> Dict[str, dict]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+def _match_students(records: list, remaining: List[Tuple[str, str]]) -> dict:
+    # GPT לפעמים משמיט את הסיומת או משנה אותיות גדולות בשם הקובץ
+    by_name = {filename: filename for filename, _ in remaining}
+    by_stem = {os.path.splitext(filename)[0].lower(): filename for filename, _ in remaining}
+    matched = {}
+    for record in records:
+        name = str(record["student"])
+        filename = by_name.get(name) or by_stem.get(os.path.splitext(name)[0].lower())
+        if filename and filename not in matched:
+            matched[filename] = {**record, "student": filename}
+    return matched
+
+
+class ChatCompletionBackend(GraderBackend):
+    # כל שרת שמדבר את ה־API של OpenAI: OpenAI עצמו או מודל מקומי
+    supports_batching = True
+    cacheable = True
+
+    def __init__(
+        self,
+        name: str,
+        model: str = GRADING_MODEL,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        temperature: float = GRADING_TEMPERATURE,
+    ):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key
+        self.temperature = temperature
+        self._client: Optional[AsyncOpenAI] = None
+        self._throttle: Optional[AdaptiveThrottle] = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            # הניסיונות החוזרים מנוהלים כאן, לא בתוך הספרייה
+            self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+        return self._client
+
+    @property
+    def throttle(self) -> AdaptiveThrottle:
+        # מגבלה אחת לכל ה־backend, גם כשכמה עבודות רצות במקביל;
+        # מתכווצת ומשהה קריאות לפי כותרות ה־rate limit של הספק
+        if self._throttle is None:
+            self._throttle = AdaptiveThrottle(self.max_concurrency)
+        return self._throttle
+
+    async def complete(self, prompt: str, **fields) -> str:
+        tokens = count_tokens(prompt, self.model) + self.max_output_tokens
+        waited = await self.throttle.acquire(tokens)
+        if waited > 0.001:
+            LLM_THROTTLE_SECONDS.observe(waited, model=self.model)
+        status, headers = None, None
+        try:
+            with span("llm_call", backend=self.name, model=self.model, **fields):
+                raw = await self.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=self.temperature,
+                    max_tokens=self.max_output_tokens,
+                )
+            status, headers = raw.status_code, raw.headers
+            response = raw.parse()
+        except APIStatusError as e:
+            status, headers = e.status_code, e.response.headers
+            if status == 429:
+                LLM_RATE_LIMITED.inc(model=self.model)
+            raise
+        finally:
+            await self.throttle.release(status, headers)
+        if response.usage:
+            PROMPT_TOKENS.inc(response.usage.prompt_tokens, model=self.model)
+            COMPLETION_TOKENS.inc(response.usage.completion_tokens, model=self.model)
+        return (response.choices[0].message.content or "").strip()
+
+    async def grade_batch(self, batch, context, on_records=None):
+        remaining = list(batch)
+        graded = {}
+        last_error = None
+
+        for attempt in range(MAX_RETRIES + 1):
+            if attempt:
+                delay = RETRY_BASE_DELAY * (2 ** (attempt - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay))
+
+            # בכל ניסיון נשלחים רק התלמידים שעוד חסרים
+            prompt = context.render(remaining)
+            context.prompts.append(prompt)
+            LLM_CALLS.inc(model=self.model)
+            if attempt:
+                LLM_RETRIES.inc(model=self.model)
+            try:
+                gpt_output = await self.complete(prompt, students=len(remaining), attempt=attempt)
+            except RETRYABLE_ERRORS as e:
+                log_event(
+                    "llm_call_failed", logging.WARNING,
+                    backend=self.name, attempt=attempt + 1, attempts=MAX_RETRIES + 1, error=str(e),
+                )
+                last_error = e
+                continue
+
+            with span("parse_output"):
+                records, complete = parse_grading_output(gpt_output)
+            matched = _match_students(records, remaining)
+            if not complete:
+                ERRORS.inc(stage="parse_output")
+                log_event(
+                    "partial_output", logging.WARNING,
+                    backend=self.name, recovered=len(matched), students=len(remaining),
+                )
+
+            if on_records and matched:
+                await on_records(matched)
+            graded.update(matched)
+            remaining = [(filename, text) for filename, text in remaining if filename not in graded]
+            if not remaining:
+                return graded
+
+        missing = ", ".join(filename for filename, _ in remaining)
+        raise GradingError(f"Invalid GPT output. Missing results for: {missing}") from last_error
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class RuleBasedMultichoiceBackend(GraderBackend):
+    # השוואה ישירה מול מפתח התשובות; דטרמיניסטי ולוקלי, ללא LLM.
+    # דפים שלא זוהו במלואם לא מוחזרים, וה־engine שולח אותם ל־LLM.
+    name = "rule_based"
+    model = "answer-key"
+    supports_batching = True
+    local = True
+
+    async def grade_batch(self, batch, context, on_records=None):
+        questions = context.questions
+        key = parse_answer_text(context.answer_key_text or context.solution_text)
+        if not key.covers(questions):
+            # שאלה בלי מפתח לא נבדקת כאן; כל המנה עוברת ל־LLM
+            return {}
+        sheets = [
+            parse_answer_text(context.answer_sheets.get(filename) or text)
+            for filename, text in batch
+        ]
+        # דף שחסרה בו תשובה או שיש בו סימון סותר לאחת השאלות עובר כולו ל־LLM,
+        # במקום לקבל 0 על שאלה שפשוט לא נקראה
+        confident = [index for index, sheet in enumerate(sheets) if sheet.covers(questions)]
+        if not confident:
+            return {}
+
+        grades = score_answer_sheets(key, [sheets[i] for i in confident], questions)
+        overall = grades.mean(axis=1).round(2)
+        graded = {}
+        for row, index in enumerate(confident):
+            filename = batch[index][0]
+            graded[filename] = {
+                "student": filename,
+                "grades": [
+                    {"question_number": q, "grade": int(grade)}
+                    for q, grade in zip(questions, grades[row].tolist())
+                ],
+                "overall_score": float(overall[row]),
+            }
+        return graded
+
+
+_backends: Dict[str, GraderBackend] = {}
+
+
+def get_backend(name: str) -> GraderBackend:
+    if name not in _backends:
+        if name == "openai":
+            _backends[name] = ChatCompletionBackend("openai", api_key=os.getenv("OPENAI_API_KEY"))
+        elif name == "openai_compatible":
+            _backends[name] = ChatCompletionBackend(
+                "openai_compatible", base_url=GRADER_BASE_URL, api_key=GRADER_API_KEY
+            )
+        elif name == "rule_based":
+            _backends[name] = RuleBasedMultichoiceBackend()
+        else:
+            raise ValueError(f"Unknown grader backend: {name}")
+    return _backends[name]
+
+
+def default_backend() -> GraderBackend:
+    return get_backend(GRADER_BACKEND)
+
+
+def select_backend(project_type: str, solution_text: str, num_questions: int) -> GraderBackend:
+    if project_type == "multichoice" and MULTICHOICE_BACKEND == "rule_based":
+        # רק כשמפתח התשובות מכסה את כל השאלות אפשר לוותר על ה־LLM
+        if parse_answer_text(solution_text).covers(list(range(1, num_questions + 1))):
+            return get_backend("rule_based")
+    return default_backend()
+
+
+async def close_backends():
+    for backend in _backends.values():
+        await backend.close()
+    _backends.clear()
+
+
+def throttle_stats() -> dict:
+    return {
+        name: backend.throttle.snapshot()
+        for name, backend in _backends.items()
+        if isinstance(backend, ChatCompletionBackend)
+    }
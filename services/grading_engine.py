@@ -0,0 +1,163 @@
+# services/grading_engine.py
+
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from services.cache import grading_cache, hash_key
+from services.grader_backends import (
+    GRADING_MODEL,
+    PROMPT_BUILDERS,
+    GraderBackend,
+    GradingContext,
+    GradingError,
+    build_prompt,
+    default_backend,
+    select_backend,
+)
+from utils.metrics import log_event
+from prompt_builder.compaction import count_tokens, truncate_to_tokens
+
+# הערכה גסה של טוקנים לכל תלמיד בפלט (שם קובץ + שורה לכל שאלה)
+OUTPUT_TOKENS_PER_STUDENT = 30
+OUTPUT_TOKENS_PER_QUESTION = 15
+
+
+def split_into_batches(
+    student_texts: List[Tuple[str, str]],
+    header_tokens: int,
+    num_questions: int,
+    backend: GraderBackend,
+) -> List[List[Tuple[str, str]]]:
+    if not backend.supports_batching:
+        return [[student] for student in student_texts]
+    if backend.local:
+        return [list(student_texts)]
+
+    input_budget = backend.context_tokens - backend.max_output_tokens - header_tokens
+    if input_budget <= 0:
+        raise GradingError("Solution and instructions alone exceed the model context.")
+
+    output_per_student = OUTPUT_TOKENS_PER_STUDENT + OUTPUT_TOKENS_PER_QUESTION * max(num_questions, 1)
+    max_students = max(1, backend.max_output_tokens // output_per_student)
+
+    batches = []
+    current = []
+    current_tokens = 0
+    for filename, text in student_texts:
+        tokens = count_tokens(f"STUDENT: {filename}\n{text}", backend.model)
+        if tokens > input_budget:
+            # מבחן בודד שחורג מהתקציב נחתך כדי לא להפיל את כל הבקשה
+            log_event("student_truncated", logging.WARNING, student=filename, tokens=tokens, budget=input_budget)
+            text = truncate_to_tokens(text, input_budget - count_tokens(filename) - 8, backend.model)
+            tokens = input_budget
+
+        if current and (current_tokens + tokens > input_budget or len(current) >= max_students):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+
+        current.append((filename, text))
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+async def _grade_with_backend(
+    backend: GraderBackend,
+    context: GradingContext,
+    student_texts: List[Tuple[str, str]],
+    on_batch_done: Optional[Callable[[int, int], None]] = None,
+    refresh: Optional[Set[str]] = None,
+    on_records: Optional[Callable[[Dict[str, dict]], None]] = None,
+) -> dict:
+    # 🔹 מטמון לכל תלמיד לפי (פרומפט, backend, מודל, טמפרטורה)
+    # הרינדור, ה־hash וספירת הטוקנים לכל הכיתה רצים ב־thread, לא על ה־event loop
+    cache_keys = {}
+    cached = {}
+    if backend.cacheable:
+        def lookup():
+            keys = {
+                filename: hash_key(context.render([(filename, text)]), backend.name, backend.model, backend.temperature)
+                for filename, text in student_texts
+            }
+            # תלמידים שנשלחו לבדיקה חוזרת במפורש לא נלקחים מהמטמון (אבל התוצאה החדשה נשמרת בו)
+            return keys, {
+                filename: grading_cache.get(key) for filename, key in keys.items() if filename not in (refresh or ())
+            }
+
+        cache_keys, cached = await asyncio.to_thread(lookup)
+    graded = {filename: record for filename, record in cached.items() if record is not None}
+    if on_records and graded:
+        on_records(graded)
+    pending = [(filename, text) for filename, text in student_texts if filename not in graded]
+
+    batches = await asyncio.to_thread(
+        lambda: split_into_batches(
+            pending, count_tokens(context.render([]), backend.model), context.num_questions, backend
+        )
+    ) if pending else []
+
+    async def store(records: dict):
+        if cache_keys:
+            await asyncio.to_thread(
+                lambda: [grading_cache.set(cache_keys[name], record) for name, record in records.items()]
+            )
+
+    done = 0
+
+    async def run(batch):
+        nonlocal done
+        batch_results = await backend.grade_batch(batch, context, on_records=store)
+        done += 1
+        if on_records and batch_results:
+            on_records(batch_results)
+        if on_batch_done:
+            on_batch_done(done, len(batches))
+        return batch_results
+
+    # 🔹 שליחת כל המנות במקביל; המגבלה על מספר הבקשות היא ב־backend
+    for batch_results in await asyncio.gather(*(run(batch) for batch in batches)):
+        graded.update(batch_results)
+    return graded
+
+
+async def grade_students(
+    project_type: str,
+    subject: str,
+    num_questions: int,
+    solution_text: str,
+    expected_average: Optional[int],
+    student_texts: List[Tuple[str, str]],
+    on_batch_done: Optional[Callable[[int, int], None]] = None,
+    question_numbers: Optional[List[int]] = None,
+    backend: Optional[GraderBackend] = None,
+    answer_key_text: Optional[str] = None,
+    answer_sheets: Optional[Dict[str, str]] = None,
+    refresh: Optional[Set[str]] = None,
+    on_records: Optional[Callable[[Dict[str, dict]], None]] = None,
+) -> Tuple[list, List[str]]:
+    context = GradingContext(
+        project_type, subject, num_questions, solution_text, expected_average, question_numbers,
+        answer_key_text, answer_sheets or {},
+    )
+    backend = backend or select_backend(project_type, answer_key_text or solution_text, num_questions)
+    graded = await _grade_with_backend(backend, context, student_texts, on_batch_done, refresh, on_records)
+
+    # backend שלא הצליח לבדוק חלק מהתלמידים (למשל דף תשובות שלא זוהה במלואו)
+    # מעביר אותם ל־backend ברירת המחדל
+    leftovers = [(filename, text) for filename, text in student_texts if filename not in graded]
+    if leftovers:
+        fallback = default_backend()
+        if fallback is backend:
+            raise GradingError(f"Missing results for: {', '.join(f for f, _ in leftovers)}")
+        log_event(
+            "grading_fallback", logging.WARNING,
+            backend=backend.name, fallback=fallback.name, students=len(leftovers),
+        )
+        graded.update(await _grade_with_backend(fallback, context, leftovers, on_batch_done, refresh, on_records))
+
+    results = [graded[filename] for filename, _ in student_texts]
+    return results, context.prompts
@@ -1,40 +1,33 @@
 # services/grading_service.py
 
 import os
-import json
-import fitz  # PyMuPDF
-import openai
-from dotenv import load_dotenv
+import re
+import uuid
+import asyncio
+import shutil
+import logging
 from fastapi import UploadFile
-from typing import List, Optional
+from typing import Dict, List, Optional
 import traceback
 from fastapi.responses import JSONResponse
 
-from utils.statistics import (
-    calculate_average,
-    calculate_grade_distribution,
-    calculate_median,
-    calculate_std_dev,
-)
-from prompt_builder.grading_prompts import (
-    build_open_test_prompt,
-    build_multichoice_prompt,
-    build_homework_prompt,
-)
-
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-PROJECTS_DIR = "projects"
-os.makedirs(PROJECTS_DIR, exist_ok=True)
-
-def extract_text_from_pdf(file_path):
-    try:
-        doc = fitz.open(file_path)
-        text = "".join(page.get_text() for page in doc)
-        return text
-    except Exception as e:
-        print("❌ PDF error:", e)
-        return ""
+from utils.metrics import log_event, span
+from utils.statistics import StatsAccumulator
+from utils.storage import read_json, write_json
+from services.grading_engine import GRADING_MODEL, PROMPT_BUILDERS, grade_students
+from services.grader_backends import select_backend
+from services.answer_sheets import parse_answer_text, read_layout_texts
+from prompt_builder.compaction import CHARS_PER_TOKEN, compact_student_texts, count_tokens, normalize_text
+from services import catalog
+from services.pdf_extraction import extract_pdfs
+from services.uploads import UploadBudget, UploadTooLarge, save_upload
+from services.admission import estimate_tokens
+from services.job_queue import enqueue_job
+from services.result_store import read_results, write_results
+from services.project_service import PROJECTS_DIR, find_project_path
+
+PROMPT_SEPARATOR = "\n\n" + "=" * 40 + " NEXT BATCH " + "=" * 40 + "\n\n"
+TEST_PREFIX = re.compile(r"^test_\d+_")
 
 async def handle_project_creation(
     project_id: str,
@@ -45,84 +38,592 @@ async def handle_project_creation(
     project_type: str,
     expected_average: Optional[int],
     solution_file: Optional[UploadFile],
-    test_files: List[UploadFile]
+    test_files: List[UploadFile],
+    client_id: str = "",
 ):
     try:
+        # 🔹 בדיקת סוג מבחן
+        if project_type not in PROMPT_BUILDERS:
+            return JSONResponse(status_code=400, content={"error": "Invalid project_type"})
+        if error := _check_unique_filenames(test_files):
+            return error
+
         # 🔹 יצירת תיקיות לפרויקט
         project_path = os.path.join(PROJECTS_DIR, f"{project_name}_{project_id}")
-        os.makedirs(project_path, exist_ok=True)
         tests_dir = os.path.join(project_path, "tests")
-        os.makedirs(tests_dir, exist_ok=True)
-
-        # 🔹 שמירת פתרון ובניית טקסט
-        solution_text = ""
-        if solution_file:
-            solution_path = os.path.join(project_path, f"solution_{solution_file.filename}")
-            with open(solution_path, "wb") as f:
-                f.write(await solution_file.read())
-            solution_text = extract_text_from_pdf(solution_path)
-
-        # 🔹 שמירת מבחנים ויצירת טקסטים
-        student_texts = []
-        for idx, test_file in enumerate(test_files):
-            test_path = os.path.join(tests_dir, f"test_{idx+1}_{test_file.filename}")
-            with open(test_path, "wb") as f:
-                f.write(await test_file.read())
-            student_texts.append((test_file.filename, extract_text_from_pdf(test_path)))
-
-        # 🔹 בניית פרומפט לפי סוג מבחן
-        if project_type == "open":
-            full_prompt = build_open_test_prompt(subject, num_questions, solution_text, expected_average, student_texts)
-        elif project_type == "multichoice":
-            full_prompt = build_multichoice_prompt(subject, num_questions, solution_text, expected_average, student_texts)
-        elif project_type == "homework":
-            full_prompt = build_homework_prompt(subject, num_questions, solution_text, expected_average, student_texts)
-        else:
-            return JSONResponse(status_code=400, content={"error": "Invalid project_type"})
+        await asyncio.to_thread(os.makedirs, tests_dir, exist_ok=True)
 
-        # 🔹 שמירת הפרומפט
-        with open(os.path.join(project_path, "prompt.txt"), "w", encoding="utf-8") as f:
-            f.write(full_prompt)
-
-        # 🔹 קריאה ל־OpenAI
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": full_prompt}],
-            temperature=0.0,
-            max_tokens=4000
+        # 🔹 שמירת הקבצים בזרימה לדיסק, עם hash ומגבלות גודל
+        budget = UploadBudget()
+        seen = {}
+        solution = None
+        with span("upload", files=len(test_files) + bool(solution_file)):
+            if solution_file:
+                solution_path = os.path.join(project_path, f"solution_{solution_file.filename}")
+                solution = await save_upload(solution_file, solution_path, budget)
+
+            tests = []
+            for idx, test_file in enumerate(test_files):
+                test_path = os.path.join(tests_dir, f"test_{idx+1}_{test_file.filename}")
+                tests.append(await save_upload(test_file, test_path, budget, seen=seen))
+
+        meta = {
+            "name": project_name,
+            "subject": subject,
+            "num_questions": num_questions,
+            "num_tests": num_tests,
+            "project_type": project_type,
+            "expected_average": expected_average,
+        }
+        await asyncio.to_thread(write_json, os.path.join(project_path, "meta.json"), meta, indent=2)
+
+        # 🔹 הכנסת עבודת בדיקה לתור; SQLite (עם busy timeout) רץ ב־thread, לא על ה־event loop
+        with span("enqueue"):
+            await asyncio.to_thread(
+                catalog.upsert_project, project_id, os.path.basename(project_path), meta, "grading"
+            )
+            job_id = await asyncio.to_thread(enqueue_job, "create_project", {
+                "project_id": project_id,
+                "project_path": project_path,
+                "solution_path": solution.path if solution else None,
+                "solution_hash": solution.sha256 if solution else None,
+                "test_paths": [(test.filename, test.path) for test in tests],
+                "test_hashes": [test.sha256 for test in tests],
+                **meta,
+            }, client_id=client_id, estimated_tokens=estimate_tokens(
+                sum(test.size for test in tests) + (solution.size if solution else 0)
+            ))
+
+        return JSONResponse(status_code=202, content={
+            "job_id": job_id,
+            "project_id": project_id,
+            "status": "queued",
+        })
+
+    except UploadTooLarge as e:
+        await asyncio.to_thread(shutil.rmtree, project_path, ignore_errors=True)
+        return JSONResponse(status_code=413, content={"error": str(e)})
+
+    except Exception as e:
+        log_event(
+            "project_creation_failed", logging.ERROR,
+            project_id=project_id, error=str(e), traceback=traceback.format_exc(),
         )
-        gpt_output = response['choices'][0]['message']['content'].strip()
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+# עבודות על אותו פרויקט (יצירה ובדיקות חוזרות) רצות אחת אחרי השנייה
+_project_locks: Dict[str, asyncio.Lock] = {}
 
-        # 🔹 המרה ל־JSON
+
+def _project_lock(project_id: str) -> asyncio.Lock:
+    return _project_locks.setdefault(project_id, asyncio.Lock())
+
+
+async def run_grading_job(payload: dict, report) -> dict:
+    async with _project_lock(payload["project_id"]):
         try:
-            results = json.loads(gpt_output)
-        except json.JSONDecodeError:
-            print("❌ GPT returned invalid JSON:\n", gpt_output)
-            return JSONResponse(status_code=500, content={"error": "Invalid GPT output."})
-
-        # 🔹 שמירת התוצאות
-        with open(os.path.join(project_path, "results.json"), "w", encoding="utf-8") as f:
-            json.dump(results, f, indent=2)
-
-        # 🔹 חישובי סטטיסטיקה
-        scores = [student["overall_score"] for student in results]
-
-        stats = {
-            "average": calculate_average(scores),
-            "median": calculate_median(scores),
-            "std_dev": calculate_std_dev(scores),
-            "grade_distribution": calculate_grade_distribution(scores),
+            return await _grade_project(payload, report)
+        except Exception:
+            await asyncio.to_thread(catalog.set_status, payload["project_id"], "failed")
+            raise
+
+
+async def _extract_documents(entries: list, project_type: str, report) -> dict:
+    # entries: רשומות {"path", "sha256", "text", "layout"} שמתמלאות במקום
+    paths = [entry["path"] for entry in entries]
+    hashes = [entry.get("sha256") for entry in entries]
+    with span("extract", documents=len(paths)):
+        extraction = extract_pdfs(
+            paths,
+            on_document_done=lambda done, total: report("extracting", done / total),
+            content_hashes=hashes,
+        )
+        if project_type == "multichoice":
+            # אמריקאית: גם קריאת התשובות לפי מיקום המילים בעמוד, באותו מאגר תהליכים
+            extractions, layout_texts = await asyncio.gather(extraction, read_layout_texts(paths, hashes))
+        else:
+            extractions, layout_texts = await extraction, [None] * len(paths)
+
+    for entry, extraction, layout in zip(entries, extractions, layout_texts):
+        entry["text"] = extraction.text
+        entry["layout"] = layout
+
+    return {
+        os.path.basename(extraction.path): extraction.report()
+        for extraction in extractions
+        if extraction.empty_pages or extraction.failed_pages or extraction.error
+    }
+
+
+def _write_answer_sheets(project_path: str, num_questions: int, extracted: dict):
+    questions = list(range(1, num_questions + 1))
+    solution = extracted["solution"]
+    write_json(os.path.join(project_path, "answer_sheets.json"), {
+        "answer_key": parse_answer_text((solution or {}).get("layout") or "").report(questions),
+        "students": {
+            filename: parse_answer_text(entry["layout"] or "").report(questions)
+            for filename, entry in extracted["students"].items()
+        },
+    }, indent=2)
+
+
+def _load_stats(project_path: str, results: list) -> StatsAccumulator:
+    # המצב המצטבר שנשמר בבדיקה הקודמת; אם אינו תואם לתוצאות (פרויקט ישן או מיובא) מחושב מחדש
+    state = read_json(os.path.join(project_path, "stats_state.json"))
+    if state:
+        accumulator = StatsAccumulator.from_state(state)
+        if accumulator.students == {record["student"] for record in results}:
+            return accumulator
+    return StatsAccumulator().add_results(results)
+
+
+def _update_stats(project_path: str, project_id: str, meta: dict, results: list, accumulator: StatsAccumulator) -> dict:
+    # 🔹 הסטטיסטיקה כבר נצברה בזמן הבדיקה; כאן רק הסיכום ושמירת המצב לבדיקות חוזרות
+    with span("statistics"):
+        if accumulator.students != {record["student"] for record in results}:
+            accumulator = StatsAccumulator().add_results(results)
+        stats = accumulator.to_dict()
+        write_json(os.path.join(project_path, "stats_state.json"), accumulator.to_state())
+
+    # 🔹 עדכון הקטלוג
+    with span("catalog_update"):
+        catalog.upsert_project(
+            project_id, os.path.basename(project_path), meta, "graded",
+            stats=stats, num_tests=len(results),
+        )
+    return stats
+
+
+async def _grade_project(payload: dict, report) -> dict:
+    project_path = payload["project_path"]
+    project_type = payload["project_type"]
+    subject = payload["subject"]
+    num_questions = payload["num_questions"]
+    expected_average = payload["expected_average"]
+
+    # 🔹 חילוץ טקסט מהפתרון ומהמבחנים במאגר תהליכים; נשמר לבדיקות חוזרות
+    report("extracting", 0.0)
+    extracted = {
+        "solution": {
+            "path": payload["solution_path"], "sha256": payload.get("solution_hash"), "text": None, "layout": None,
+        } if payload["solution_path"] else None,
+        "students": {},
+    }
+    hashes = payload.get("test_hashes") or [None] * len(payload["test_paths"])
+    for (filename, path), sha256 in zip(payload["test_paths"], hashes):
+        extracted["students"][filename] = {"path": path, "sha256": sha256, "text": None, "layout": None}
+
+    entries = list(extracted["students"].values())
+    if extracted["solution"]:
+        entries.append(extracted["solution"])
+    extraction_report = await _extract_documents(entries, project_type, report)
+    await asyncio.to_thread(write_json, os.path.join(project_path, "extraction.json"), extraction_report, indent=2)
+    await asyncio.to_thread(write_json, os.path.join(project_path, "extracted.json"), extracted)
+
+    solution_text = extracted["solution"]["text"] if extracted["solution"] else ""
+    answer_key_text = extracted["solution"]["layout"] if extracted["solution"] else None
+    student_texts = [(filename, entry["text"]) for filename, entry in extracted["students"].items()]
+    answer_sheets = {
+        filename: entry["layout"] for filename, entry in extracted["students"].items() if entry["layout"]
+    }
+
+    # 🔹 ניקוי הטקסט: רווחים, מספרי עמודים ושורות שחוזרות בכל המבחנים
+    def prepare():
+        raw = sum(count_tokens(text, GRADING_MODEL) for _, text in student_texts)
+        solution = normalize_text(solution_text)
+        return (raw, solution, *compact_student_texts(student_texts, template_text=solution))
+
+    with span("build_prompt"):
+        raw_tokens, solution_text, student_texts, boilerplate = await asyncio.to_thread(prepare)
+
+    # 🔹 בדיקה במנות מקבילות; אמריקאית עם מפתח תשובות נבדקת בלי LLM
+    backend = select_backend(project_type, answer_key_text or solution_text, num_questions)
+    # הסטטיסטיקה מתעדכנת עם כל מנה שהסתיימה
+    accumulator = StatsAccumulator()
+    report("grading", 0.0)
+    with span("grade", students=len(student_texts), backend=backend.name):
+        results, prompts = await grade_students(
+            project_type, subject, num_questions, solution_text, expected_average, student_texts,
+            on_batch_done=lambda done, total: report("grading", done / total),
+            on_records=lambda records: accumulator.add_results(records.values()),
+            backend=backend,
+            answer_key_text=answer_key_text,
+            answer_sheets=answer_sheets,
+        )
+
+    # 🔹 שמירת הפרומפטים ודוח טוקנים
+    report("saving", 0.0)
+
+    def save() -> dict:
+        with open(os.path.join(project_path, "prompt.txt"), "w", encoding="utf-8") as f:
+            f.write(PROMPT_SEPARATOR.join(prompts))
+
+        prompt_stats = {
+            "backend": backend.name,
+            "model": backend.model,
+            "batches": len(prompts),
+            "prompt_tokens": sum(count_tokens(prompt, GRADING_MODEL) for prompt in prompts),
+            "student_text_tokens_raw": raw_tokens,
+            "student_text_tokens_compacted": sum(count_tokens(text, GRADING_MODEL) for _, text in student_texts),
+            "boilerplate_lines_removed": boilerplate,
         }
+        write_json(os.path.join(project_path, "prompt_stats.json"), prompt_stats, indent=2)
+
+        if answer_sheets:
+            _write_answer_sheets(project_path, num_questions, extracted)
+
+        # 🔹 שמירת התוצאות: שורה לכל תלמיד + מטריצת ציונים
+        write_results(project_path, results)
+        return prompt_stats
+
+    with span("save"):
+        prompt_stats = await asyncio.to_thread(save)
+
+    stats = await asyncio.to_thread(
+        _update_stats, project_path, payload["project_id"], payload, results, accumulator
+    )
+
+    return {
+        "project_name": payload["name"],
+        "project_id": payload["project_id"],
+        "num_tests": payload["num_tests"],
+        "expected_average": expected_average,
+        "results_url": f"/projects/{payload['project_id']}/results",
+        "stats": stats,
+        "extraction_warnings": extraction_report,
+        "prompt_stats": prompt_stats,
+    }
 
-        return {
-            "project_name": project_name,
+
+# 🔹 בדיקה חוזרת: הוספת/החלפת מבחנים ובדיקה של חלק מהתלמידים או מהשאלות
+
+def _load_extracted(project_path: str) -> dict:
+    extracted = read_json(os.path.join(project_path, "extracted.json"))
+    if extracted is not None:
+        return extracted
+
+    # פרויקט שנוצר לפני שמירת הטקסט: הכל יחולץ מחדש (בדרך כלל מהמטמון)
+    tests_dir = os.path.join(project_path, "tests")
+    students = {}
+    for name in sorted(os.listdir(tests_dir)) if os.path.isdir(tests_dir) else []:
+        if not name.endswith(".part"):
+            students[TEST_PREFIX.sub("", name, count=1)] = {
+                "path": os.path.join(tests_dir, name), "sha256": None, "text": None, "layout": None,
+            }
+    solution = next(
+        (name for name in sorted(os.listdir(project_path)) if name.startswith("solution_") and not name.endswith(".part")),
+        None,
+    )
+    return {
+        "solution": {
+            "path": os.path.join(project_path, solution), "sha256": None, "text": None, "layout": None,
+        } if solution else None,
+        "students": students,
+    }
+
+
+def _check_unique_filenames(test_files: List[UploadFile]) -> Optional[JSONResponse]:
+    # התלמידים מזוהים לפי שם הקובץ; שני קבצים באותו שם (למשל scan.pdf) היו דורסים זה את זה
+    seen, duplicates = set(), []
+    for test_file in test_files:
+        if test_file.filename in seen and test_file.filename not in duplicates:
+            duplicates.append(test_file.filename)
+        seen.add(test_file.filename)
+    if duplicates:
+        return JSONResponse(status_code=400, content={"error": f"Duplicate test filenames: {duplicates}"})
+    return None
+
+
+def _new_test_path(tests_dir: str, filename: str) -> str:
+    index = len(os.listdir(tests_dir)) + 1
+    while os.path.exists(path := os.path.join(tests_dir, f"test_{index}_{filename}")):
+        index += 1
+    return path
+
+
+async def _enqueue_regrade(
+    project_id: str, project_path: str, client_id: str, estimated_tokens: int, **payload
+) -> JSONResponse:
+    with span("enqueue"):
+        # הסטטוס הקודם (graded / failed) חוזר אם הבדיקה החוזרת נכשלת
+        previous_status = await asyncio.to_thread(_mark_grading, project_id)
+        job_id = await asyncio.to_thread(enqueue_job, "regrade_project", {
             "project_id": project_id,
-            "num_tests": num_tests,
-            "expected_average": expected_average,
-            "results": results,
-            "stats": stats
-        }
+            "project_path": project_path,
+            "previous_status": previous_status,
+            "uploads": [],
+            "solution": None,
+            "students": None,
+            "questions": None,
+            **payload,
+        }, client_id=client_id, estimated_tokens=estimated_tokens)
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "project_id": project_id,
+        "status": "queued",
+    })
+
+
+def _mark_grading(project_id: str) -> str:
+    previous_status = catalog.get_project(project_id)["status"]
+    catalog.set_status(project_id, "grading")
+    return previous_status
 
+
+def _check_regradable(project_id: str):
+    project_path = find_project_path(project_id)
+    if project_path is None:
+        return None, JSONResponse(status_code=404, content={"error": "Project not found"})
+    if catalog.get_project(project_id)["status"] == "grading":
+        return None, JSONResponse(status_code=409, content={"error": "Project is being graded"})
+    return project_path, None
+
+
+async def handle_add_tests(project_id: str, test_files: List[UploadFile], client_id: str = ""):
+    project_path, error = await asyncio.to_thread(_check_regradable, project_id)
+    if error:
+        return error
+    if error := _check_unique_filenames(test_files):
+        return error
+
+    tests_dir = os.path.join(project_path, "tests")
+    await asyncio.to_thread(os.makedirs, tests_dir, exist_ok=True)
+    stored = []
+    try:
+        # 🔹 קבצים חדשים נשמרים בשם חדש; הקובץ הישן נמחק רק אחרי שהבדיקה הצליחה
+        budget = UploadBudget()
+        seen = {}
+        with span("upload", files=len(test_files)):
+            for test_file in test_files:
+                path = await asyncio.to_thread(_new_test_path, tests_dir, test_file.filename)
+                stored.append(await save_upload(test_file, path, budget, seen=seen))
+    except UploadTooLarge as e:
+        for upload in stored:
+            _remove_file(upload.path)
+        return JSONResponse(status_code=413, content={"error": str(e)})
     except Exception as e:
-        traceback.print_exc()
-        return JSONResponse(status_code=500, content={"error": str(e)})
\ No newline at end of file
+        log_event(
+            "add_tests_failed", logging.ERROR,
+            project_id=project_id, error=str(e), traceback=traceback.format_exc(),
+        )
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    return await _enqueue_regrade(
+        project_id, project_path, client_id, estimate_tokens(sum(upload.size for upload in stored)),
+        uploads=[(upload.filename, upload.path, upload.sha256) for upload in stored],
+    )
+
+
+async def handle_regrade(
+    project_id: str,
+    students: Optional[List[str]],
+    questions: Optional[List[int]],
+    solution_file: Optional[UploadFile],
+    client_id: str = "",
+):
+    project_path, error = await asyncio.to_thread(_check_regradable, project_id)
+    if error:
+        return error
+
+    meta = await asyncio.to_thread(read_json, os.path.join(project_path, "meta.json"), {})
+    invalid = [q for q in questions or [] if not 1 <= q <= meta.get("num_questions", 0)]
+    if invalid:
+        return JSONResponse(status_code=400, content={"error": f"Invalid question numbers: {invalid}"})
+    extracted = (await asyncio.to_thread(_load_extracted, project_path))["students"]
+    unknown = [name for name in students or [] if name not in extracted]
+    if unknown:
+        return JSONResponse(status_code=400, content={"error": f"Unknown students: {unknown}"})
+
+    solution = None
+    if solution_file:
+        path = os.path.join(project_path, f"solution_{uuid.uuid4().hex[:8]}_{solution_file.filename}")
+        try:
+            with span("upload", files=1):
+                stored = await save_upload(solution_file, path, UploadBudget())
+        except UploadTooLarge as e:
+            return JSONResponse(status_code=413, content={"error": str(e)})
+        solution = (stored.path, stored.sha256)
+
+    # הטקסט של התלמידים כבר חולץ, כך שההערכה כאן לפי הטקסט עצמו
+    targets = students or list(extracted)
+    estimated_tokens = sum(len(extracted[name].get("text") or "") for name in targets) // CHARS_PER_TOKEN
+    return await _enqueue_regrade(
+        project_id, project_path, client_id, estimated_tokens,
+        solution=solution, students=students or None, questions=sorted(set(questions)) if questions else None,
+    )
+
+
+async def run_regrade_job(payload: dict, report) -> dict:
+    async with _project_lock(payload["project_id"]):
+        try:
+            return await _regrade_project(payload, report)
+        except Exception:
+            # התוצאות הקודמות לא נגעו; הפרויקט חוזר לסטטוס שהיה לו לפני הבדיקה החוזרת
+            # (פרויקט שהבדיקה הראשונה שלו נכשלה נשאר failed ולא מוצג כבדוק)
+            await asyncio.to_thread(
+                catalog.set_status, payload["project_id"], payload.get("previous_status", "graded")
+            )
+            raise
+
+
+def _merge_question_grades(record: dict, regraded: dict, question_numbers: List[int]) -> dict:
+    wanted = set(question_numbers)
+    grades = {grade["question_number"]: grade for grade in record["grades"]}
+    grades.update({
+        grade["question_number"]: grade for grade in regraded["grades"] if grade["question_number"] in wanted
+    })
+    merged = [grades[q] for q in sorted(grades)]
+    # הציון הכולל נשאר בסקאלה שהבודק קבע (כולל ההתאמה לממוצע היעד) ומשתנה רק בהפרש
+    # של השאלות שנבדקו מחדש, כמו בשאר התלמידים שלא נבדקו מחדש
+    previous = {grade["question_number"]: grade["grade"] for grade in record["grades"]}
+    delta = sum(grades[q]["grade"] - previous.get(q, 0) for q in wanted if q in grades)
+    overall = float(record.get("overall_score") or 0) + delta / max(len(merged), 1)
+    return {**record, "grades": merged, "overall_score": round(min(max(overall, 0), 100), 2)}
+
+
+async def _regrade_project(payload: dict, report) -> dict:
+    project_path = payload["project_path"]
+    meta = await asyncio.to_thread(read_json, os.path.join(project_path, "meta.json"))
+    project_type = meta["project_type"]
+    num_questions = meta["num_questions"]
+    questions = payload["questions"]
+
+    extracted = await asyncio.to_thread(_load_extracted, project_path)
+    students = extracted["students"]
+    previous_results = await asyncio.to_thread(read_results, project_path)
+    accumulator = await asyncio.to_thread(_load_stats, project_path, previous_results)
+    results = {record["student"]: record for record in previous_results}
+    obsolete_paths = []
+
+    # 🔹 קבצים שהועלו: קובץ זהה לקיים לא נבדק שוב
+    changed = []
+    for filename, path, sha256 in payload["uploads"]:
+        entry = students.get(filename)
+        if entry and entry["sha256"] == sha256:
+            obsolete_paths.append(path)
+            continue
+        if entry:
+            obsolete_paths.append(entry["path"])
+        students[filename] = {"path": path, "sha256": sha256, "text": None, "layout": None}
+        changed.append(filename)
+
+    solution_changed = False
+    if payload["solution"]:
+        path, sha256 = payload["solution"]
+        previous = extracted["solution"]
+        if previous and previous["sha256"] == sha256:
+            obsolete_paths.append(path)
+        else:
+            if previous:
+                obsolete_paths.append(previous["path"])
+            extracted["solution"] = {"path": path, "sha256": sha256, "text": None, "layout": None}
+            solution_changed = True
+
+    # 🔹 חילוץ רק למה שאין לו טקסט שמור
+    report("extracting", 0.0)
+    entries = list(students.values()) + ([extracted["solution"]] if extracted["solution"] else [])
+    pending = [
+        entry for entry in entries
+        if entry["text"] is None or (project_type == "multichoice" and entry["layout"] is None)
+    ]
+    extraction_report = await _extract_documents(pending, project_type, report) if pending else {}
+
+    # 🔹 מי נבדק: תלמידים שביקשו + קבצים שהשתנו + מי שעדיין אין לו תוצאה
+    if payload["students"]:
+        targets = set(payload["students"]) | set(changed)
+    elif payload["uploads"] and not solution_changed and not questions:
+        targets = set(changed)
+    else:
+        targets = set(students)
+    targets |= {filename for filename in students if filename not in results}
+    # בקשה מפורשת לבדוק שוב (בלי קבצים חדשים) לא מסתפקת בתשובה השמורה במטמון
+    refresh = set(payload["students"] or []) if payload["uploads"] else set(targets)
+
+    solution_text = normalize_text(extracted["solution"]["text"]) if extracted["solution"] else ""
+    answer_key_text = extracted["solution"]["layout"] if extracted["solution"] else None
+    backend = select_backend(project_type, answer_key_text or solution_text, num_questions)
+
+    # הניקוי מחושב על כל הכיתה כדי שהטקסט של כל תלמיד יהיה זהה לבדיקה המקורית
+    compacted, _ = await asyncio.to_thread(
+        compact_student_texts,
+        [(filename, entry["text"]) for filename, entry in students.items()], template_text=solution_text,
+    )
+    compacted = dict(compacted)
+
+    # תלמיד חדש או קובץ שהוחלף נבדק במלואו; השאר רק בשאלות שנבחרו
+    full = [f for f in students if f in targets and (not questions or f not in results or f in changed)]
+    partial = [f for f in students if f in targets and f not in full]
+    groups = [(names, question_numbers) for names, question_numbers in ((full, None), (partial, questions)) if names]
+
+    prompts = []
+    report("grading", 0.0)
+    with span("grade", students=len(targets), backend=backend.name):
+        for names, question_numbers in groups:
+            regraded, group_prompts = await grade_students(
+                project_type, meta["subject"], num_questions, solution_text, meta["expected_average"],
+                [(filename, compacted[filename]) for filename in names],
+                on_batch_done=lambda done, total: report("grading", done / total),
+                question_numbers=question_numbers,
+                backend=backend,
+                answer_key_text=answer_key_text,
+                answer_sheets={f: students[f]["layout"] for f in names if students[f]["layout"]},
+                refresh=refresh,
+            )
+            prompts += group_prompts
+            replaced, updated = [], []
+            for record in regraded:
+                filename = record["student"]
+                previous = results.get(filename)
+                if previous:
+                    replaced.append(previous)
+                    if question_numbers:
+                        record = _merge_question_grades(previous, record, question_numbers)
+                results[filename] = record
+                updated.append(record)
+            # בסטטיסטיקה מתחלפות רק השורות שנבדקו מחדש
+            accumulator.replace_results(replaced, updated)
+
+    # 🔹 כתיבה אטומית של התוצאות והטקסט השמור
+    report("saving", 0.0)
+    results = list(results.values())
+    meta["num_tests"] = len(results)
+    def save():
+        if prompts:
+            with open(os.path.join(project_path, "prompt.txt"), "a", encoding="utf-8") as f:
+                f.write(PROMPT_SEPARATOR + PROMPT_SEPARATOR.join(prompts))
+        write_json(os.path.join(project_path, "extracted.json"), extracted)
+        if project_type == "multichoice":
+            _write_answer_sheets(project_path, num_questions, extracted)
+        write_results(project_path, results)
+        write_json(os.path.join(project_path, "meta.json"), meta, indent=2)
+
+    with span("save"):
+        await asyncio.to_thread(save)
+
+    stats = await asyncio.to_thread(_update_stats, project_path, payload["project_id"], meta, results, accumulator)
+
+    # קבצים שהוחלפו נמחקים רק אחרי שהתוצאות החדשות נשמרו
+    in_use = {entry["path"] for entry in students.values()}
+    if extracted["solution"]:
+        in_use.add(extracted["solution"]["path"])
+    for path in set(obsolete_paths) - in_use:
+        await asyncio.to_thread(_remove_file, path)
+
+    return {
+        "project_name": meta["name"],
+        "project_id": payload["project_id"],
+        "num_tests": len(results),
+        "regraded_students": sorted(targets),
+        "regraded_questions": questions,
+        "results_url": f"/projects/{payload['project_id']}/results",
+        "stats": stats,
+        "extraction_warnings": extraction_report,
+    }
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,341 @@
+# services/job_queue.py
+
+import os
+import json
+import socket
+import time
+import uuid
+import asyncio
+import importlib
+import logging
+import sqlite3
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from utils.db import SQLiteConnections
+from utils.metrics import log_event, span
+
+JOBS_DB = os.getenv("JOBS_DB", os.path.join("data", "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# 0 = ללא הגבלה; לקוח יחיד יכול לתפוס את כל ה־workers כשאף אחד אחר לא מחכה
+MAX_RUNNING_PER_CLIENT = int(os.getenv("JOB_MAX_RUNNING_PER_CLIENT", "0"))
+POLL_INTERVAL = 1.0
+# המתנה אחרי שגיאה בלולאת ה־worker (DB נעול, כתיבה שנכשלה), עד MAX_ERROR_BACKOFF
+ERROR_BACKOFF = 1.0
+MAX_ERROR_BACKOFF = 30.0
+# עבודה רצה מחזיקה lease שמתחדש כל שליש מהזמן; רק lease שפג חוזר לתור,
+# כך שהפעלה מחדש של תהליך אחד לא מריצה שוב עבודות של תהליכים חיים
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+TERMINAL_STATUSES = ("done", "failed")
+ACTIVE_STATUSES = ("queued", "running")
+
+# handler(payload, report) -> result; report(stage, progress)
+JobHandler = Callable[[dict, Callable[[str, float], None]], Awaitable[dict]]
+
+# handler או נתיב "module:function" שנטען רק כשעבודה מהסוג הזה רצה לראשונה
+_handlers: Dict[str, Union[JobHandler, str]] = {}
+_wakeup: Optional[asyncio.Event] = None
+_workers: list = []
+# עדכוני התקדמות נכתבים ב־thread אחד, לפי הסדר, בלי לחסום את ה־event loop
+_progress_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-progress")
+
+
+_connect = SQLiteConnections(JOBS_DB, row_factory=sqlite3.Row)
+
+
+def init_db():
+    with _connect() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                progress REAL NOT NULL DEFAULT 0,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                client_id TEXT NOT NULL DEFAULT '',
+                estimated_tokens INTEGER NOT NULL DEFAULT 0,
+                started_at REAL,
+                owner TEXT,
+                lease_expires REAL
+            )
+        """)
+        # מסדי נתונים שנוצרו לפני העמודות של בקרת הכניסה
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in (
+            ("client_id", "TEXT NOT NULL DEFAULT ''"),
+            ("estimated_tokens", "INTEGER NOT NULL DEFAULT 0"),
+            ("started_at", "REAL"),
+            ("owner", "TEXT"),
+            ("lease_expires", "REAL"),
+        ):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_client ON jobs (status, client_id)")
+
+
+def _row_to_job(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def register_handler(kind: str, handler: Union[JobHandler, str]):
+    _handlers[kind] = handler
+
+
+def _resolve_handler(kind: str) -> Optional[JobHandler]:
+    handler = _handlers.get(kind)
+    if isinstance(handler, str):
+        module_name, _, attribute = handler.partition(":")
+        handler = _handlers[kind] = getattr(importlib.import_module(module_name), attribute)
+    return handler
+
+
+def enqueue_job(kind: str, payload: dict, client_id: str = "", estimated_tokens: int = 0) -> str:
+    job_id = str(uuid.uuid4())
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, stage, payload, created_at, updated_at, client_id, estimated_tokens) "
+            "VALUES (?, ?, 'queued', 'queued', ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload, ensure_ascii=False), now, now, client_id, estimated_tokens),
+        )
+    if _wakeup is not None:
+        _wakeup.set()
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row) if row else None
+
+
+def update_job(job_id: str, owner: Optional[str] = None, **fields) -> bool:
+    # עם owner העדכון חל רק אם העבודה עדיין שייכת לאותו worker
+    if "result" in fields:
+        fields["result"] = json.dumps(fields["result"], ensure_ascii=False)
+    fields["updated_at"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    condition, params = ("id = ? AND owner = ?", (job_id, owner)) if owner else ("id = ?", (job_id,))
+    with _connect() as conn:
+        cursor = conn.execute(f"UPDATE jobs SET {columns} WHERE {condition}", (*fields.values(), *params))
+    return cursor.rowcount > 0
+
+
+def renew_lease(job_id: str) -> bool:
+    with _connect() as conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND owner = ? AND status = 'running'",
+            (time.time() + LEASE_SECONDS, job_id, WORKER_ID),
+        )
+    return cursor.rowcount > 0
+
+
+def active_usage() -> Dict[str, Tuple[int, int]]:
+    # client_id -> (עבודות בתור או בריצה, סך הטוקנים המוערך שלהן)
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT client_id, COUNT(*), COALESCE(SUM(estimated_tokens), 0) FROM jobs "
+            "WHERE status IN (?, ?) GROUP BY client_id",
+            ACTIVE_STATUSES,
+        ).fetchall()
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def recent_job_seconds(limit: int = 20) -> Optional[float]:
+    # משך ריצה ממוצע של העבודות האחרונות שהסתיימו, להערכת Retry-After
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT AVG(updated_at - started_at) FROM ("
+            "  SELECT updated_at, started_at FROM jobs WHERE status = 'done' AND started_at IS NOT NULL"
+            "  ORDER BY updated_at DESC LIMIT ?"
+            ")",
+            (limit,),
+        ).fetchone()
+    return row[0]
+
+
+# העבודה הבאה שייכת ללקוח עם הכי מעט עבודות רצות, ובתוכו לוותיקה ביותר:
+# לקוח ששלח עשר כיתות לא מעכב לקוח ששלח אחת אחריו
+_NEXT_JOB_SQL = """
+    SELECT q.*, (
+        SELECT COUNT(*) FROM jobs AS r WHERE r.status = 'running' AND r.client_id = q.client_id
+    ) AS client_running
+    FROM jobs AS q
+    WHERE q.status = 'queued' AND (? = 0 OR client_running < ?)
+      -- עבודות על אותו פרויקט לא רצות במקביל, גם בתהליכים שונים
+      AND NOT EXISTS (
+        SELECT 1 FROM jobs AS p WHERE p.status = 'running'
+          AND json_extract(p.payload, '$.project_id') = json_extract(q.payload, '$.project_id')
+      )
+    ORDER BY client_running, q.created_at
+    LIMIT 1
+"""
+
+
+def claim_next_job() -> Optional[dict]:
+    conn = _connect()
+    try:
+        # BEGIN IMMEDIATE נועל לכתיבה, כך ששני workers לא יקבלו את אותה עבודה
+        conn.execute("BEGIN IMMEDIATE")
+        _requeue_expired(conn)
+        row = conn.execute(_NEXT_JOB_SQL, (MAX_RUNNING_PER_CLIENT, MAX_RUNNING_PER_CLIENT)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = 'running', stage = 'starting', started_at = ?, updated_at = ?, "
+            "owner = ?, lease_expires = ? WHERE id = ?",
+            (now, now, WORKER_ID, now + LEASE_SECONDS, row["id"]),
+        )
+        conn.execute("COMMIT")
+        job = _row_to_job(row)
+        job.pop("client_running")
+        return job
+    except Exception:
+        # BEGIN IMMEDIATE עצמו יכול להיכשל (database is locked) ואז אין מה לבטל
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+_REQUEUE_SQL = (
+    "UPDATE jobs SET status = 'queued', stage = 'queued', progress = 0, owner = NULL, "
+    "lease_expires = NULL, updated_at = ? WHERE status = 'running' AND "
+)
+
+
+def _requeue_expired(conn: sqlite3.Connection) -> int:
+    # עבודות של worker שנפל (ה־lease לא חודש) חוזרות לתור; NULL - עבודות מלפני ה־leases
+    now = time.time()
+    cursor = conn.execute(_REQUEUE_SQL + "(lease_expires IS NULL OR lease_expires < ?)", (now, now))
+    return cursor.rowcount
+
+
+def requeue_interrupted_jobs() -> int:
+    with _connect() as conn:
+        return _requeue_expired(conn)
+
+
+def release_owned_jobs() -> int:
+    # כיבוי מסודר: העבודות של התהליך הזה חוזרות לתור מיד, בלי לחכות שה־lease יפוג
+    with _connect() as conn:
+        cursor = conn.execute(_REQUEUE_SQL + "owner = ?", (time.time(), WORKER_ID))
+    return cursor.rowcount
+
+
+async def _keep_lease(job_id: str, work: asyncio.Task, lease: dict):
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        try:
+            renewed = await asyncio.to_thread(renew_lease, job_id)
+        except Exception as e:
+            # ננסה שוב בחידוש הבא; ה־lease תקף עוד שני מחזורים
+            log_event("job_lease_renew_failed", logging.WARNING, job_id=job_id, error=str(e))
+            continue
+        if not renewed:
+            # העבודה הוחזרה לתור ונלקחה ע"י worker אחר; לא ממשיכים לכתוב לאותו פרויקט
+            lease["lost"] = True
+            work.cancel()
+            return
+
+
+async def _run_job(job: dict):
+    try:
+        handler = await asyncio.to_thread(_resolve_handler, job["kind"])
+        error = None if handler else f"Unknown job kind: {job['kind']}"
+    except Exception as e:
+        # handler שלא נטען ייכשל גם בפעם הבאה; עבודה שחוזרת לתור הייתה נתקעת בלולאה
+        error = f"Cannot load handler for {job['kind']}: {e}"
+    if error:
+        log_event("job_failed", logging.ERROR, job_id=job["id"], kind=job["kind"], error=error)
+        await asyncio.to_thread(update_job, job["id"], owner=WORKER_ID, status="failed", error=error)
+        return
+
+    loop = asyncio.get_running_loop()
+
+    def report(stage: str, progress: float):
+        loop.run_in_executor(
+            _progress_writer,
+            lambda: update_job(job["id"], owner=WORKER_ID, stage=stage, progress=round(progress, 3)),
+        )
+
+    async def finish(**fields):
+        # באותו thread כמו עדכוני ההתקדמות, כך שעדכון ישן לא ידרוס את הסיום
+        await loop.run_in_executor(_progress_writer, lambda: update_job(job["id"], owner=WORKER_ID, **fields))
+
+    lease = {"lost": False}
+    work = asyncio.create_task(handler(job["payload"], report))
+    heartbeat = asyncio.create_task(_keep_lease(job["id"], work, lease))
+    try:
+        with span("job", kind=job["kind"], job_id=job["id"]):
+            result = await work
+        await finish(status="done", stage="done", progress=1.0, result=result)
+    except asyncio.CancelledError:
+        if not lease["lost"]:
+            raise
+        log_event("job_lease_lost", logging.WARNING, job_id=job["id"], kind=job["kind"])
+    except Exception as e:
+        log_event(
+            "job_failed", logging.ERROR,
+            job_id=job["id"], kind=job["kind"], error=str(e), traceback=traceback.format_exc(),
+        )
+        await finish(status="failed", error=str(e))
+    finally:
+        heartbeat.cancel()
+
+
+async def _worker_loop(worker_id: int):
+    backoff = ERROR_BACKOFF
+    while True:
+        try:
+            job = await asyncio.to_thread(claim_next_job)
+            if job is None:
+                _wakeup.clear()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            log_event("job_started", worker=worker_id, job_id=job["id"], kind=job["kind"])
+            await _run_job(job)
+            backoff = ERROR_BACKOFF
+        except Exception as e:
+            # שגיאה באיטרציה אחת לא מפילה את ה־worker; עבודה שלא סומנה כגמורה
+            # חוזרת לתור כשה־lease שלה פג
+            log_event(
+                "worker_error", logging.ERROR,
+                worker=worker_id, error=str(e), traceback=traceback.format_exc(), retry_in=backoff,
+            )
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_ERROR_BACKOFF)
+
+
+def start_workers(count: int = JOB_WORKERS):
+    global _wakeup
+    init_db()
+    requeue_interrupted_jobs()
+    _wakeup = asyncio.Event()
+    for worker_id in range(count):
+        _workers.append(asyncio.create_task(_worker_loop(worker_id)))
+
+
+async def stop_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    await asyncio.to_thread(release_owned_jobs)
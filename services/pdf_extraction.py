@@ -0,0 +1,269 @@
+# services/pdf_extraction.py
+
+import os
+import asyncio
+import logging
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, List, Optional
+
+from prompt_builder.compaction import PAGE_BREAK
+from services.cache import hash_file, hash_key, text_cache
+from utils.metrics import ERRORS, PAGES_EXTRACTED, log_event
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 2)))
+PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", "16"))
+DEFAULT_MAX_PAGES = int(os.getenv("EXTRACTION_MAX_PAGES", "0")) or None
+DEFAULT_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", "120"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class ExtractionPoolError(RuntimeError):
+    # המאגר עצמו נכשל (תהליך עבודה קרס גם אחרי החלפת המאגר) - העבודה נכשלת
+    # במקום לבדוק מבחנים ריקים
+    pass
+
+
+@dataclass
+class PageText:
+    page_number: int  # מתחיל מ־1
+    text: str
+    error: Optional[str] = None
+
+
+@dataclass
+class ExtractionResult:
+    path: str
+    page_count: int = 0
+    pages: List[PageText] = field(default_factory=list)
+    empty_pages: List[int] = field(default_factory=list)
+    failed_pages: List[int] = field(default_factory=list)
+    timed_out: bool = False
+    error: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        return PAGE_BREAK.join(page.text for page in self.pages)
+
+    def report(self) -> dict:
+        return {
+            "page_count": self.page_count,
+            "extracted_pages": len(self.pages) - len(self.failed_pages),
+            "empty_pages": self.empty_pages,
+            "failed_pages": self.failed_pages,
+            "timed_out": self.timed_out,
+            "error": self.error,
+        }
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn ולא fork: תהליך השרת מריץ threads ו־event loop
+        _pool = ProcessPoolExecutor(
+            max_workers=EXTRACTION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+async def warm_pool():
+    # מפעיל את כל תהליכי העבודה מראש וטוען בהם את PyMuPDF, כדי שהמסמך הראשון לא ישלם על זה
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    await asyncio.gather(*(loop.run_in_executor(pool, _warm_worker) for _ in range(EXTRACTION_WORKERS)))
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _discard_broken_pool(pool: ProcessPoolExecutor):
+    # תהליך שמת (OOM, קריסה של MuPDF) משבית את כל המאגר; מחליפים אותו רק אם
+    # אף קריאה מקבילה לא החליפה אותו כבר
+    if pool is _pool:
+        shutdown_pool()
+
+
+async def run_in_pool(func, *args):
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = get_pool()
+        try:
+            return await loop.run_in_executor(pool, func, *args)
+        except BrokenProcessPool as e:
+            _discard_broken_pool(pool)
+            if attempt:
+                raise ExtractionPoolError(f"Extraction worker crashed: {e}") from e
+
+
+# 🔹 פונקציות שרצות בתהליכי העבודה
+
+def _warm_worker():
+    import fitz  # noqa: F401  PyMuPDF
+
+
+def _count_pages(path: str) -> int:
+    import fitz  # PyMuPDF
+
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> list:
+    import fitz  # PyMuPDF
+
+    pages = []
+    with fitz.open(path) as doc:
+        for index in range(start, stop):
+            try:
+                pages.append((index + 1, doc[index].get_text(), None))
+            except Exception as e:
+                pages.append((index + 1, "", str(e)))
+    return pages
+
+
+# 🔹 ממשק אסינכרוני
+
+async def iter_pdf_pages(
+    path: str,
+    max_pages: Optional[int] = DEFAULT_MAX_PAGES,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+) -> AsyncIterator[PageText]:
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    deadline = loop.time() + timeout if timeout else None
+
+    page_count = await asyncio.wait_for(
+        loop.run_in_executor(pool, _count_pages, path), timeout
+    )
+    if max_pages:
+        page_count = min(page_count, max_pages)
+
+    # מסמכים גדולים מתפצלים לטווחי עמודים שרצים במקביל
+    ranges = {
+        loop.run_in_executor(pool, _extract_page_range, path, start, min(start + PAGES_PER_TASK, page_count)):
+            (start, min(start + PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PAGES_PER_TASK)
+    }
+    pending = set(ranges)
+
+    try:
+        while pending:
+            remaining = deadline - loop.time() if deadline else None
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise asyncio.TimeoutError
+            for future in done:
+                for page_number, text, error in future.result():
+                    yield PageText(page_number, text, error)
+    except asyncio.TimeoutError:
+        # תהליך שכבר רץ לא ניתן לעצירה; מבטלים את מה שעוד לא התחיל
+        for future in pending:
+            future.cancel()
+        for future in pending:
+            start, stop = ranges[future]
+            for index in range(start, stop):
+                yield PageText(index + 1, "", "timeout")
+
+
+async def extract_pdf(
+    path: str,
+    max_pages: Optional[int] = DEFAULT_MAX_PAGES,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    content_hash: Optional[str] = None,
+) -> ExtractionResult:
+    result = ExtractionResult(path=path)
+
+    # 🔹 מטמון לפי hash של תוכן הקובץ
+    if content_hash is None:
+        try:
+            content_hash = await asyncio.to_thread(hash_file, path)
+        except OSError as e:
+            log_event("pdf_extraction_failed", logging.WARNING, path=path, error=str(e))
+            result.error = str(e)
+            return result
+    cache_key = hash_key("pdf_text", content_hash, max_pages)
+    cached = await asyncio.to_thread(text_cache.get, cache_key)
+    if cached is not None:
+        result.pages = [PageText(*page) for page in cached]
+        _summarize(result)
+        return result
+
+    for attempt in range(2):
+        pool = get_pool()
+        result.pages = []
+        try:
+            async for page in iter_pdf_pages(path, max_pages, timeout):
+                result.pages.append(page)
+            break
+        except BrokenProcessPool as e:
+            _discard_broken_pool(pool)
+            if attempt:
+                ERRORS.inc(stage="extract")
+                raise ExtractionPoolError(f"Extraction worker crashed ({path}): {e}") from e
+        except asyncio.TimeoutError:
+            result.timed_out = True
+            result.error = "timeout"
+            break
+        except Exception as e:
+            log_event(
+                "pdf_extraction_failed", logging.WARNING,
+                path=path, error=str(e), traceback=traceback.format_exc(),
+            )
+            result.error = str(e)
+            break
+
+    _summarize(result)
+    PAGES_EXTRACTED.inc(result.page_count - len(result.failed_pages))
+    if result.error or result.failed_pages:
+        ERRORS.inc(stage="extract")
+    if not result.timed_out and not result.error and not result.failed_pages:
+        pages = [[page.page_number, page.text, page.error] for page in result.pages]
+        await asyncio.to_thread(text_cache.set, cache_key, pages)
+    return result
+
+
+def _summarize(result: ExtractionResult):
+    result.pages.sort(key=lambda page: page.page_number)
+    result.page_count = len(result.pages)
+    for page in result.pages:
+        if page.error:
+            result.failed_pages.append(page.page_number)
+            if page.error == "timeout":
+                result.timed_out = True
+        elif not page.text.strip():
+            # בדרך כלל עמוד סרוק ללא שכבת טקסט
+            result.empty_pages.append(page.page_number)
+
+
+async def extract_pdfs(
+    paths: List[str],
+    max_pages: Optional[int] = DEFAULT_MAX_PAGES,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+    on_document_done: Optional[Callable[[int, int], None]] = None,
+    content_hashes: Optional[List[Optional[str]]] = None,
+) -> List[ExtractionResult]:
+    done = 0
+    content_hashes = content_hashes or [None] * len(paths)
+
+    async def run(path, content_hash):
+        nonlocal done
+        result = await extract_pdf(path, max_pages, timeout, content_hash)
+        done += 1
+        if on_document_done:
+            on_document_done(done, len(paths))
+        return result
+
+    return await asyncio.gather(*(run(path, h) for path, h in zip(paths, content_hashes)))
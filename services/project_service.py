@@ -2,10 +2,18 @@
 
 import os
 import json
+import time
+import uuid
+import logging
+import traceback
+from typing import Optional
 from models.project import ProjectCreateRequest
+from services import catalog
+from utils.metrics import log_event, span
+from utils.statistics import summarize_results
+from services.result_store import has_results, read_results
 
 PROJECTS_DIR = "projects"
-os.makedirs(PROJECTS_DIR, exist_ok=True)
 
 def handle_create_project(data: ProjectCreateRequest):
     folder_name = f"{data.project_name}_{data.subject}".replace(" ", "_")
@@ -24,41 +32,78 @@ def handle_create_project(data: ProjectCreateRequest):
     return {"message": "✅ Project created", "folder": folder_name}
 
 
-def get_all_projects():
-    project_list = []
-
-    if not os.path.exists(PROJECTS_DIR):
-        return []
-
-    for folder_name in os.listdir(PROJECTS_DIR):
-        folder_path = os.path.join(PROJECTS_DIR, folder_name)
-        meta_path = os.path.join(folder_path, "meta.json")
-        results_path = os.path.join(folder_path, "results.json")
-
-        try:
-            with open(meta_path, "r", encoding="utf-8") as f:
-                meta = json.load(f)
-            with open(results_path, "r", encoding="utf-8") as f:
-                results = json.load(f)
-
-            scores = [s["overall_score"] for s in results]
-            stats = {
-                "average": calculate_average(scores),
-                "median": calculate_median(scores),
-                "std_dev": calculate_std_dev(scores),
-                "grade_distribution": calculate_grade_distribution(scores),
-            }
-
-            project_list.append({
-                "project_id": folder_name,
-                "project_name": meta["name"],
-                "subject": meta["subject"],
-                "num_questions": meta["num_questions"],
-                "num_tests": len(scores),
-                "stats": stats,
-            })
-
-        except Exception as e:
-            print(f"❌ Error loading project {folder_name}:", e)
-
-    return project_list
+def get_all_projects(
+    offset: int = 0,
+    limit: int = 50,
+    subject: Optional[str] = None,
+    project_type: Optional[str] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+):
+    with span("catalog_query"):
+        return catalog.list_projects(offset, limit, subject, project_type, sort, order)
+
+
+def find_project_path(project_id: str) -> Optional[str]:
+    project = catalog.get_project(project_id)
+    if project is None:
+        return None
+    project_path = os.path.join(PROJECTS_DIR, project["folder"])
+    return project_path if os.path.isdir(project_path) else None
+
+
+def _folder_project_id(folder_name: str) -> str:
+    # תיקיות נוצרות בשם f"{project_name}_{project_id}"
+    candidate = folder_name.rsplit("_", 1)[-1]
+    try:
+        return str(uuid.UUID(candidate))
+    except ValueError:
+        return folder_name
+
+
+def import_existing_projects() -> int:
+    # ייבוא חד־פעמי של תיקיות פרויקטים שנוצרו לפני הקטלוג
+    if catalog.get_flag("folders_imported"):
+        return 0
+
+    imported = 0
+    if os.path.exists(PROJECTS_DIR):
+        for folder_name in os.listdir(PROJECTS_DIR):
+            folder_path = os.path.join(PROJECTS_DIR, folder_name)
+            meta_path = os.path.join(folder_path, "meta.json")
+            if not os.path.isdir(folder_path):
+                continue
+
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+
+                stats = None
+                num_tests = None
+                # תיקייה בלי תוצאות: אין עבודה שתסיים אותה, ובדיקה חוזרת תבדוק את כולה
+                status = "failed"
+                if has_results(folder_path):
+                    results = read_results(folder_path)
+                    stats = summarize_results(results)
+                    num_tests = len(results)
+                    status = "graded"
+
+                catalog.upsert_project(
+                    _folder_project_id(folder_name),
+                    folder_name,
+                    meta,
+                    status,
+                    stats=stats,
+                    num_tests=num_tests,
+                    created_at=os.path.getmtime(folder_path),
+                )
+                imported += 1
+
+            except Exception as e:
+                log_event(
+                    "project_import_failed", logging.ERROR,
+                    folder=folder_name, error=str(e), traceback=traceback.format_exc(),
+                )
+
+    catalog.set_flag("folders_imported", str(time.time()))
+    return imported
@@ -0,0 +1,67 @@
+# services/response_parser.py
+
+import re
+import json
+import logging
+from typing import List, Tuple
+
+import orjson
+from pydantic import ValidationError
+
+from models.grading import StudentResult
+from utils.metrics import log_event
+
+FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL | re.IGNORECASE)
+
+_decoder = json.JSONDecoder()
+
+
+def strip_fences(text: str) -> str:
+    match = FENCE.search(text)
+    return match.group(1).strip() if match else text.strip()
+
+
+def _recover_objects(text: str) -> list:
+    # שחזור כל אובייקט שלם מתוך מערך שנחתך באמצע (למשל בגלל max_tokens)
+    start = text.find("{")
+    if start < 0:
+        return []
+
+    objects = []
+    position = start
+    while position < len(text):
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position >= len(text) or text[position] != "{":
+            break
+        try:
+            obj, position = _decoder.raw_decode(text, position)
+        except json.JSONDecodeError:
+            break
+        objects.append(obj)
+    return objects
+
+
+def parse_grading_output(text: str) -> Tuple[List[dict], bool]:
+    # מחזיר את רשומות התלמידים התקינות והאם הפלט כולו היה JSON תקין
+    body = strip_fences(text)
+    try:
+        parsed = orjson.loads(body)
+        complete = True
+    except orjson.JSONDecodeError:
+        parsed = _recover_objects(body)
+        complete = False
+
+    if isinstance(parsed, dict):
+        parsed = [parsed]
+    if not isinstance(parsed, list):
+        return [], False
+
+    records = []
+    for item in parsed:
+        try:
+            records.append(StudentResult.model_validate(item).model_dump())
+        except ValidationError as e:
+            log_event("invalid_student_record", logging.WARNING, error=str(e.errors()[:1]))
+            complete = False
+    return records, complete
@@ -0,0 +1,121 @@
+# services/result_store.py
+#
+# שמירת תוצאות בפורמט שאפשר לקרוא בלי לטעון את כל הפרויקט:
+#   results.jsonl      - רשומת JSON אחת לכל תלמיד, בסדר המקורי
+#   results.idx.npy    - היסט בבתים של תחילת כל שורה (N+1 ערכים), לדפדוף ישיר
+#   grades.npy         - מטריצת ציונים תלמידים×שאלות (float32, NaN כשאין ציון)
+#   results_summary.json - מספר התלמידים, שמותיהם ומספרי השאלות של העמודות
+
+import io
+import os
+import mmap
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from utils.statistics import grades_matrix
+from utils.storage import atomic_write, read_json, write_json
+
+RESULTS_FILE = "results.jsonl"
+INDEX_FILE = "results.idx.npy"
+GRADES_FILE = "grades.npy"
+SUMMARY_FILE = "results_summary.json"
+LEGACY_RESULTS_FILE = "results.json"
+
+
+def _npy_bytes(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def write_results(project_path: str, results: List[dict]):
+    lines = [orjson.dumps(record) for record in results]
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([len(line) + 1 for line in lines], out=offsets[1:])
+    question_numbers, matrix = grades_matrix(results)
+
+    # הקובץ הראשי נכתב אחרון; אינדקס שלא מתאים לגודלו מזוהה בקריאה ונבנה מחדש
+    atomic_write(os.path.join(project_path, GRADES_FILE), _npy_bytes(matrix.astype(np.float32)))
+    atomic_write(os.path.join(project_path, INDEX_FILE), _npy_bytes(offsets))
+    atomic_write(os.path.join(project_path, RESULTS_FILE), b"".join(line + b"\n" for line in lines))
+    write_json(os.path.join(project_path, SUMMARY_FILE), {
+        "count": len(results),
+        "students": [record["student"] for record in results],
+        "question_numbers": question_numbers.tolist(),
+    })
+
+    legacy_path = os.path.join(project_path, LEGACY_RESULTS_FILE)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+
+def has_results(project_path: str) -> bool:
+    return any(
+        os.path.exists(os.path.join(project_path, name)) for name in (RESULTS_FILE, LEGACY_RESULTS_FILE)
+    )
+
+
+def read_results(project_path: str) -> List[dict]:
+    path = os.path.join(project_path, RESULTS_FILE)
+    if not os.path.exists(path):
+        # פרויקטים ישנים שנשמרו כ־results.json אחד
+        return read_json(os.path.join(project_path, LEGACY_RESULTS_FILE), [])
+    with open(path, "rb") as f:
+        return [orjson.loads(line) for line in f if line.strip()]
+
+
+def _line_offsets(project_path: str, size: int, data) -> np.ndarray:
+    try:
+        offsets = np.load(os.path.join(project_path, INDEX_FILE), mmap_mode="r")
+        if len(offsets) and offsets[-1] == size:
+            return offsets
+    except (OSError, ValueError):
+        pass
+    # אין אינדקס תקין: סריקה אחת של תווי שורה חדשה
+    ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n")) + 1
+    return np.concatenate(([0], ends)).astype(np.int64)
+
+
+def count_results(project_path: str) -> int:
+    summary = read_json(os.path.join(project_path, SUMMARY_FILE))
+    if summary is not None:
+        return summary["count"]
+    return len(read_results(project_path))
+
+
+def iter_result_lines(project_path: str, offset: int = 0, limit: Optional[int] = None) -> Iterator[bytes]:
+    # מחזיר את השורות כפי שהן על הדיסק, בלי פענוח וקידוד מחדש
+    path = os.path.join(project_path, RESULTS_FILE)
+    if not os.path.exists(path):
+        records = read_results(project_path)
+        stop = len(records) if limit is None else offset + limit
+        for record in records[offset:stop]:
+            yield orjson.dumps(record)
+        return
+
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        offsets = _line_offsets(project_path, size, data)
+        count = len(offsets) - 1
+        stop = count if limit is None else min(count, offset + limit)
+        for row in range(offset, stop):
+            yield data[int(offsets[row]):int(offsets[row + 1]) - 1]
+
+
+def load_grades(project_path: str) -> Tuple[List[str], List[int], np.ndarray]:
+    summary = read_json(os.path.join(project_path, SUMMARY_FILE))
+    grades_path = os.path.join(project_path, GRADES_FILE)
+    if summary is None or not os.path.exists(grades_path):
+        results = read_results(project_path)
+        question_numbers, matrix = grades_matrix(results)
+        return [record["student"] for record in results], question_numbers.tolist(), matrix
+    try:
+        grades = np.load(grades_path, mmap_mode="r")
+    except ValueError:
+        # מטריצה ריקה אי אפשר למפות לזיכרון
+        grades = np.load(grades_path)
+    return summary["students"], summary["question_numbers"], grades
@@ -0,0 +1,134 @@
+# services/throttle.py
+#
+# קצב הקריאות לספק ה־LLM לפי מה שהספק עצמו מדווח בכותרות התשובה:
+#   x-ratelimit-remaining-requests / x-ratelimit-remaining-tokens - כמה נשאר בחלון הנוכחי
+#   x-ratelimit-reset-requests / x-ratelimit-reset-tokens          - עוד כמה זמן החלון מתאפס ("1s", "6m0s", "20ms")
+#   retry-after / retry-after-ms                                    - בתשובת 429
+# בנוסף, המקביליות יורדת בחצי אחרי 429 ועולה בהדרגה אחרי הצלחות (AIMD).
+
+import re
+import time
+import asyncio
+from typing import Mapping, Optional
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    # "12", "0.5", "20ms", "6m0s", "1h2m3.5s" -> שניות
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None  # למשל retry-after בפורמט תאריך
+    return sum(float(amount) * _UNITS[unit] for amount, unit in parts)
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    if headers is None:
+        return None
+    milliseconds = parse_duration(headers.get("retry-after-ms"))
+    if milliseconds is not None:
+        return milliseconds / 1000
+    return parse_duration(headers.get("retry-after"))
+
+
+class AdaptiveThrottle:
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        # אחרי שהחלון התאפס המכסה לא ידועה עד התשובה הבאה
+        if self.requests_reset_at <= now:
+            self.remaining_requests = None
+        if self.tokens_reset_at <= now:
+            self.remaining_tokens = None
+
+        wait = self.paused_until - now
+        if self.remaining_requests is not None and self.remaining_requests < 1:
+            wait = max(wait, self.requests_reset_at - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens:
+            wait = max(wait, self.tokens_reset_at - now)
+        return wait
+
+    async def acquire(self, tokens: int) -> float:
+        # מחזיר כמה שניות הקריאה חיכתה
+        start = time.monotonic()
+        async with self.condition:
+            while True:
+                wait = self._wait_time(tokens, time.monotonic())
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                try:
+                    await asyncio.wait_for(self.condition.wait(), wait if wait > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+            if self.remaining_tokens is not None:
+                self.remaining_tokens -= tokens
+        return time.monotonic() - start
+
+    async def release(self, status: Optional[int] = None, headers: Optional[Mapping[str, str]] = None):
+        # status הוא None כשלא התקבלה תשובה בכלל (timeout, חיבור)
+        async with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if headers is not None:
+                self._update(headers, now)
+            if status == 429:
+                self.paused_until = max(self.paused_until, now + (retry_after(headers) or 1.0))
+                self.limit = max(1.0, self.limit / 2)
+            elif status is not None and status < 400:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def _update(self, headers: Mapping[str, str], now: float):
+        remaining = _parse_int(headers.get("x-ratelimit-remaining-requests"))
+        reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if remaining is not None and reset is not None:
+            self.remaining_requests = remaining
+            self.requests_reset_at = now + reset
+
+        remaining = _parse_int(headers.get("x-ratelimit-remaining-tokens"))
+        reset = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        if remaining is not None and reset is not None:
+            self.remaining_tokens = remaining
+            self.tokens_reset_at = now + reset
+
+    def snapshot(self) -> dict:
+        return {
+            "concurrency_limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3),
+            "remaining_requests": self.remaining_requests,
+            "remaining_tokens": self.remaining_tokens,
+        }
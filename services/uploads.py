@@ -0,0 +1,97 @@
+# services/uploads.py
+
+import os
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+
+import anyio
+from fastapi import Request, UploadFile
+from fastapi.responses import JSONResponse
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(50 * 1024 * 1024)))
+MAX_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+@dataclass
+class StoredUpload:
+    filename: str
+    path: str
+    sha256: str
+    size: int
+
+
+class UploadBudget:
+    # מגבלת גודל כוללת לכל הקבצים בבקשה אחת
+
+    def __init__(self, max_bytes: int = MAX_REQUEST_BYTES):
+        self.remaining = max_bytes
+
+    def consume(self, size: int, filename: str):
+        self.remaining -= size
+        if self.remaining < 0:
+            raise UploadTooLarge(f"Request exceeds {MAX_REQUEST_BYTES} bytes (at {filename})")
+
+
+async def save_upload(
+    upload: UploadFile,
+    dest_path: str,
+    budget: UploadBudget,
+    max_bytes: int = MAX_FILE_BYTES,
+    seen: Optional[dict] = None,
+) -> StoredUpload:
+    # בדיקה מוקדמת לפי הגודל שהפרסר כבר יודע, לפני קריאה כלשהי
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(f"{upload.filename} exceeds {max_bytes} bytes")
+
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = dest_path + ".part"
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as f:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{upload.filename} exceeds {max_bytes} bytes")
+                budget.consume(len(chunk), upload.filename)
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        await anyio.to_thread.run_sync(_remove_quietly, tmp_path)
+        raise
+
+    sha256 = digest.hexdigest()
+
+    # 🔹 קובץ זהה שכבר נשמר באותה בקשה - משתמשים בעותק הקיים
+    if seen is not None and sha256 in seen:
+        await anyio.to_thread.run_sync(os.remove, tmp_path)
+        return StoredUpload(upload.filename, seen[sha256], sha256, size)
+
+    await anyio.to_thread.run_sync(os.replace, tmp_path, dest_path)
+    if seen is not None:
+        seen[sha256] = dest_path
+    return StoredUpload(upload.filename, dest_path, sha256, size)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def limit_request_size(request: Request, call_next):
+    # דחייה לפי Content-Length לפני שהפרסר של multipart קורא את הגוף
+    content_length = request.headers.get("content-length")
+    if request.method == "POST" and content_length and content_length.isdigit():
+        if int(content_length) > MAX_REQUEST_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"error": f"Request exceeds {MAX_REQUEST_BYTES} bytes"},
+            )
+    return await call_next(request)
@@ -0,0 +1,46 @@
+import asyncio
+
+from services.answer_sheets import parse_answer_text, score_answer_sheets
+from services.grader_backends import GradingContext, RuleBasedMultichoiceBackend
+
+KEY = "1. B\n2. C\n3. D\n4. A\n5. E"
+QUESTIONS = [1, 2, 3, 4, 5]
+
+
+def _context(answer_sheets):
+    return GradingContext(
+        project_type="multichoice", subject="Physics", num_questions=5, solution_text=KEY,
+        expected_average=None, answer_key_text=KEY, answer_sheets=answer_sheets,
+    )
+
+
+def test_question_stems_and_headers_are_not_answers():
+    sheet = parse_answer_text(
+        "Class 10 B\n"
+        "3. A 2 kg mass slides down a ramp\n"
+        "1 B 2 C 3 D\n"
+        "4 A 5 E\n"
+    )
+
+    assert sheet.answers == {1: "B", 2: "C", 3: "D", 4: "A", 5: "E"}
+    assert sheet.conflicts == set()
+    assert score_answer_sheets(parse_answer_text(KEY), [sheet], QUESTIONS).tolist() == [[100] * 5]
+
+
+def test_answer_line_with_label_is_read():
+    assert parse_answer_text("Answers: 1. B 2. C").answers == {1: "B", 2: "C"}
+
+
+def test_incomplete_or_conflicting_sheets_fall_back():
+    sheets = {
+        "full.pdf": "1 B 2 C 3 D 4 A 5 E",
+        "missing.pdf": "1 B 2 C 3 D 4 A",
+        "conflict.pdf": "1 B 2 C 3 D 4 A 5 E\n3 A",
+    }
+    batch = [(filename, "") for filename in sheets]
+
+    graded = asyncio.run(RuleBasedMultichoiceBackend().grade_batch(batch, _context(sheets)))
+
+    assert list(graded) == ["full.pdf"]
+    assert graded["full.pdf"]["overall_score"] == 100.0
+    assert [grade["grade"] for grade in graded["full.pdf"]["grades"]] == [100] * 5
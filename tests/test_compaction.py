@@ -0,0 +1,47 @@
+from prompt_builder.compaction import PAGE_BREAK, compact_student_texts, normalize_pages, normalize_text
+
+
+def test_shared_correct_answer_is_kept():
+    correct = "Question 1\nF = m*a = 10*2 = 20 N\nQuestion 2\nThe net force is zero"
+    wrong = "Question 1\nF = m/a = 10/2 = 5 N\nQuestion 2\nThe net force is zero"
+    students = [(f"s{i}.pdf", correct) for i in range(4)] + [("s4.pdf", wrong)]
+
+    compacted, boilerplate = compact_student_texts(students)
+
+    assert boilerplate == []
+    assert [text for _, text in compacted] == [correct] * 4 + [wrong]
+
+
+def test_page_headers_and_instructions_are_removed():
+    header = "Physics 101 - Midterm exam"
+    instructions = "Answer all questions in the space provided"
+    pages = [
+        f"{header}\n{instructions}\nQuestion 1\nF = m*a = 10*2 = 20 N",
+        f"{header}\nQuestion 2\nThe net force is zero",
+    ]
+    text = PAGE_BREAK.join(pages)
+    students = [(f"s{i}.pdf", text) for i in range(5)]
+
+    compacted, boilerplate = compact_student_texts(students, template_text=f"{instructions}\nQuestion 1\n...")
+
+    assert boilerplate == sorted([header, instructions])
+    assert compacted[0][1] == "Question 1\nF = m*a = 10*2 = 20 N\nQuestion 2\nThe net force is zero"
+
+
+def test_numeric_answers_are_kept():
+    text = "Question 1\nThe answer is:\n42\nQuestion 2\nProbability:\n3/4"
+
+    assert normalize_text(text) == text
+    assert normalize_pages(PAGE_BREAK.join(["Question 1\n42", "Question 2\n3/4"])) == [
+        "Question 1\n42", "Question 2\n3/4",
+    ]
+
+
+def test_page_numbers_at_page_edges_are_removed():
+    pages = [
+        "Page 1 of 3\nQuestion 1\n42",
+        "Question 2\n3/4\n2",
+        "- 3 -\nQuestion 3\n7",
+    ]
+
+    assert normalize_pages(PAGE_BREAK.join(pages)) == ["Question 1\n42", "Question 2\n3/4", "Question 3\n7"]
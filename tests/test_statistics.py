@@ -0,0 +1,32 @@
+from utils.statistics import StatsAccumulator, summarize_results
+
+
+def _record(student, grades):
+    return {
+        "student": student,
+        "grades": [{"question_number": q, "grade": grade} for q, grade in enumerate(grades, start=1)],
+        "overall_score": sum(grades) / len(grades),
+    }
+
+
+RESULTS = [
+    _record("a.pdf", [100, 0, 100]),
+    _record("b.pdf", [0, 0, 100]),
+    _record("c.pdf", [100, 100, 0]),
+    _record("d.pdf", [100, 100, 100]),
+]
+
+
+def test_merged_batches_match_a_full_pass():
+    accumulator = StatsAccumulator().add_results(RESULTS[:1]).merge(StatsAccumulator().add_results(RESULTS[1:]))
+
+    assert accumulator.to_dict() == summarize_results(RESULTS)
+
+
+def test_replacing_rows_matches_a_full_pass():
+    regraded = _record("b.pdf", [100, 100, 100])
+    state = StatsAccumulator().add_results(RESULTS).to_state()
+
+    accumulator = StatsAccumulator.from_state(state).replace_results([RESULTS[1]], [regraded])
+
+    assert accumulator.to_dict() == summarize_results([RESULTS[0], regraded, *RESULTS[2:]])
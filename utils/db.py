@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import threading
+from typing import Callable, Optional
+
+_registry: list = []
+
+
+class SQLiteConnections:
+    # חיבור SQLite אחד לכל thread שנשמר בין קריאות, במקום connect + PRAGMA בכל פעולה.
+    # חיבורים של threads שהסתיימו נסגרים בפתיחה הבאה, והשאר ב־close_all_connections().
+
+    def __init__(
+        self,
+        path: str,
+        row_factory=None,
+        setup: Optional[Callable[[sqlite3.Connection], None]] = None,
+    ):
+        self.path = path
+        self.row_factory = row_factory
+        self.setup = setup
+        self._lock = threading.Lock()
+        self._connections: dict = {}  # thread -> connection
+        self._initialized = False
+        _registry.append(self)
+
+    def __call__(self) -> sqlite3.Connection:
+        thread = threading.current_thread()
+        conn = self._connections.get(thread)
+        if conn is None:
+            conn = self._open()
+            with self._lock:
+                for other in [t for t in self._connections if not t.is_alive()]:
+                    self._connections.pop(other).close()
+                self._connections[thread] = conn
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # check_same_thread כבוי רק כדי שאפשר יהיה לסגור מ־thread אחר; כל חיבור משמש thread אחד
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        if self.row_factory:
+            conn.row_factory = self.row_factory
+        conn.execute("PRAGMA journal_mode=WAL")
+        if not self._initialized:
+            if self.setup:
+                self.setup(conn)
+            self._initialized = True
+        return conn
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, {}
+        for conn in connections.values():
+            conn.close()
+
+
+def close_all_connections():
+    for connections in _registry:
+        connections.close()
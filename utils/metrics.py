@@ -0,0 +1,164 @@
+import sys
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+logger = logging.getLogger("checkmate")
+
+# spans של הבקשה הנוכחית, עבור כותרת Server-Timing
+_request_spans: ContextVar[Optional[list]] = ContextVar("request_spans", default=None)
+
+_lock = threading.Lock()
+_metrics: dict = {}
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_labels(key)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(key: tuple) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def counter(name: str, help_text: str) -> Counter:
+    return _metrics.setdefault(name, Counter(name, help_text))
+
+
+def histogram(name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in list(_metrics.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = histogram("checkmate_stage_duration_seconds", "Duration of pipeline stages")
+REQUEST_SECONDS = histogram("checkmate_request_duration_seconds", "HTTP request duration")
+PAGES_EXTRACTED = counter("checkmate_pdf_pages_extracted_total", "PDF pages extracted")
+PROMPT_TOKENS = counter("checkmate_llm_prompt_tokens_total", "Prompt tokens sent to the grading model")
+COMPLETION_TOKENS = counter("checkmate_llm_completion_tokens_total", "Completion tokens returned by the grading model")
+LLM_CALLS = counter("checkmate_llm_calls_total", "Grading model calls")
+LLM_RETRIES = counter("checkmate_llm_retries_total", "Grading model calls that were retries")
+LLM_RATE_LIMITED = counter("checkmate_llm_rate_limited_total", "Grading model calls rejected with 429")
+LLM_THROTTLE_SECONDS = histogram("checkmate_llm_throttle_wait_seconds", "Time grading model calls waited for the provider rate limit")
+ADMISSION_REJECTED = counter("checkmate_admission_rejected_total", "Grading requests rejected by admission control")
+CACHE_HITS = counter("checkmate_cache_hits_total", "Cache hits")
+CACHE_MISSES = counter("checkmate_cache_misses_total", "Cache misses")
+ERRORS = counter("checkmate_errors_total", "Errors by stage")
+
+
+# 🔹 לוגים מובנים
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: int = logging.INFO):
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def log_event(event: str, level: int = logging.INFO, **fields):
+    logger.log(level, event, extra={"fields": fields})
+
+
+# 🔹 מדידת זמנים
+
+@contextmanager
+def span(stage: str, **fields):
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        ERRORS.inc(stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.observe(duration, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, duration))
+        log_event("span", stage=stage, duration_ms=round(duration * 1000, 2), error=error, **fields)
+
+
+def start_request_timing():
+    return _request_spans.set([])
+
+
+def finish_request_timing(token) -> str:
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+    return ", ".join(f"{stage};dur={duration * 1000:.1f}" for stage, duration in spans)
@@ -1,51 +1,234 @@
-import math
+import numpy as np
+
+GRADE_LETTERS = ['A', 'B', 'C', 'D', 'F']
+# גבולות תחתונים לפי סדר עולה: F < 60 <= D < 70 <= C < 80 <= B < 90 <= A
+GRADE_THRESHOLDS = np.array([60, 70, 80, 90])
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+DEFAULT_BINS = 10
+SCORE_RANGE = (0, 100)
 
-def calculate_grade_distribution(grades: list[int]) -> dict[str, float]:
-    total = len(grades)
-    if total == 0:
-        return {'A': 0.0, 'B': 0.0, 'C': 0.0, 'D': 0.0, 'F': 0.0}
 
-    distribution = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'F': 0}
-    for grade in grades:
-        if grade >= 90:
-            distribution['A'] += 1
-        elif grade >= 80:
-            distribution['B'] += 1
-        elif grade >= 70:
-            distribution['C'] += 1
-        elif grade >= 60:
-            distribution['D'] += 1
-        else:
-            distribution['F'] += 1
+def _as_array(grades) -> np.ndarray:
+    return np.asarray(grades, dtype=np.float64).ravel()
 
-    for k in distribution:
-        distribution[k] = round(distribution[k] / total * 100, 2)
 
-    return distribution
+def _grade_counts(scores: np.ndarray) -> np.ndarray:
+    # מחזיר ספירה לפי הסדר A, B, C, D, F
+    buckets = np.searchsorted(GRADE_THRESHOLDS, scores, side='right')
+    return np.bincount(buckets, minlength=5)[::-1]
+
+
+def _distribution(counts: np.ndarray, total: int) -> dict[str, float]:
+    if total == 0:
+        return {letter: 0.0 for letter in GRADE_LETTERS}
+    return {letter: round(float(c) / total * 100, 2) for letter, c in zip(GRADE_LETTERS, counts)}
+
+
+def calculate_grade_distribution(grades: list[int]) -> dict[str, float]:
+    scores = _as_array(grades)
+    return _distribution(_grade_counts(scores), len(scores))
 
 
 def calculate_average(grades: list[int]) -> float:
-    if not grades:
+    if not len(grades):
         return 0.0
-    return round(sum(grades) / len(grades), 2)
+    return round(float(np.mean(grades)), 2)
 
 
 def calculate_std_dev(grades: list[int]) -> float:
-    n = len(grades)
-    if n == 0:
+    if not len(grades):
         return 0.0
-    mean = sum(grades) / n
-    variance = sum((g - mean) ** 2 for g in grades) / n
-    return round(math.sqrt(variance), 2)
+    return round(float(np.std(grades)), 2)
 
 
 def calculate_median(grades: list[int]) -> float:
-    n = len(grades)
-    if n == 0:
+    if not len(grades):
         return 0.0
-    grades_sorted = sorted(grades)
-    mid = n // 2
-    if n % 2 == 0:
-        return round((grades_sorted[mid - 1] + grades_sorted[mid]) / 2, 2)
-    else:
-        return grades_sorted[mid]
+    return round(float(np.median(grades)), 2)
+
+
+def compute_statistics(
+    grades,
+    bins: int = DEFAULT_BINS,
+    percentiles: tuple = DEFAULT_PERCENTILES,
+) -> dict:
+    scores = _as_array(grades)
+    n = len(scores)
+    if n == 0:
+        return {
+            "count": 0,
+            "average": 0.0,
+            "median": 0.0,
+            "std_dev": 0.0,
+            "min": 0.0,
+            "max": 0.0,
+            "percentiles": {str(p): 0.0 for p in percentiles},
+            "histogram": {"edges": np.linspace(*SCORE_RANGE, bins + 1).tolist(), "counts": [0] * bins},
+            "grade_distribution": _distribution(np.zeros(5), 0),
+        }
+
+    # חציון ואחוזונים בקריאה אחת (partition ולא מיון מלא)
+    points = sorted(set(percentiles) | {50})
+    values = dict(zip(points, np.percentile(scores, points)))
+    low = min(SCORE_RANGE[0], float(scores.min()))
+    high = max(SCORE_RANGE[1], float(scores.max()))
+    counts, edges = np.histogram(scores, bins=bins, range=(low, high))
+
+    return {
+        "count": n,
+        "average": round(float(scores.mean()), 2),
+        "median": round(float(values[50]), 2),
+        "std_dev": round(float(scores.std()), 2),
+        "min": round(float(scores.min()), 2),
+        "max": round(float(scores.max()), 2),
+        "percentiles": {str(p): round(float(values[p]), 2) for p in percentiles},
+        "histogram": {"edges": np.round(edges, 2).tolist(), "counts": counts.tolist()},
+        "grade_distribution": _distribution(_grade_counts(scores), n),
+    }
+
+
+def grades_matrix(results: list[dict], num_questions: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+    # מטריצת תלמידים x שאלות; NaN כשאין ציון לשאלה
+    question_numbers = sorted({
+        int(g["question_number"])
+        for student in results
+        for g in student.get("grades", [])
+        if isinstance(g, dict) and "question_number" in g
+    })
+    if num_questions:
+        question_numbers = sorted(set(question_numbers) | set(range(1, num_questions + 1)))
+
+    index = {q: i for i, q in enumerate(question_numbers)}
+    matrix = np.full((len(results), len(question_numbers)), np.nan)
+    for row, student in enumerate(results):
+        for g in student.get("grades", []):
+            if isinstance(g, dict) and "question_number" in g and "grade" in g:
+                matrix[row, index[int(g["question_number"])]] = g["grade"]
+    return np.array(question_numbers, dtype=int), matrix
+
+
+def _question_sums(matrix: np.ndarray, totals: np.ndarray):
+    # n, Σq, Σq², Σt, Σt², Σqt לכל שאלה, בהתעלמות מתאים ריקים
+    valid = ~np.isnan(matrix) & ~np.isnan(totals)[:, None]
+    q = np.where(valid, matrix, 0.0)
+    t = np.where(valid, np.nan_to_num(totals)[:, None], 0.0)
+    return (
+        valid.sum(axis=0).astype(np.float64),
+        q.sum(axis=0),
+        (q * q).sum(axis=0),
+        t.sum(axis=0),
+        (t * t).sum(axis=0),
+        (q * t).sum(axis=0),
+    )
+
+
+def _question_stats_from_sums(question_numbers, n, sq, sq2, st, st2, sqt) -> list[dict]:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sq / n
+        cov = sqt / n - mean * (st / n)
+        var_q = sq2 / n - mean ** 2
+        var_t = st2 / n - (st / n) ** 2
+        # discrimination: מתאם פירסון בין הציון בשאלה לציון הכולל
+        discrimination = cov / np.sqrt(var_q * var_t)
+
+    return [
+        {
+            "question_number": int(number),
+            "count": int(count),
+            "mean": round(float(m), 2) if count else None,
+            "difficulty": round(float(m) / 100, 3) if count else None,
+            "discrimination": round(float(d), 3) if np.isfinite(d) else None,
+        }
+        for number, count, m, d in zip(question_numbers, n, mean, discrimination)
+    ]
+
+
+class StatsAccumulator:
+    # מצטבר שניתן לאחד: מעדכנים בכל מנה של תלמידים בלי לחשב הכול מחדש.
+    # הציון הכולל נשמר לפי תלמיד, כך שתלמיד שנבדק שוב מוחלף ולא נספר פעמיים.
+
+    def __init__(self, bins: int = DEFAULT_BINS):
+        self.bins = bins
+        self.scores: dict[str, float] = {}
+        self.question_numbers = np.empty(0, dtype=int)
+        self.question_sums = tuple(np.empty(0) for _ in range(6))
+
+    def add_results(self, results) -> "StatsAccumulator":
+        results = [student for student in results if student["student"] not in self.scores]
+        if results:
+            self.scores.update({student["student"]: _score(student) for student in results})
+            self._add(*_results_sums(results))
+        return self
+
+    def remove_results(self, results) -> "StatsAccumulator":
+        results = [student for student in results if student["student"] in self.scores]
+        if results:
+            for student in results:
+                del self.scores[student["student"]]
+            question_numbers, sums = _results_sums(results)
+            self._add(question_numbers, tuple(-values for values in sums))
+        return self
+
+    def replace_results(self, previous, results) -> "StatsAccumulator":
+        # בבדיקה חוזרת: רק השורות שהשתנו יוצאות ונכנסות
+        return self.remove_results(previous).add_results(results)
+
+    def merge(self, other: "StatsAccumulator") -> "StatsAccumulator":
+        overlap = self.scores.keys() & other.scores.keys()
+        if overlap:
+            raise ValueError(f"Students counted twice: {sorted(overlap)[:5]}")
+        self.scores.update(other.scores)
+        self._add(other.question_numbers, other.question_sums)
+        return self
+
+    def _add(self, question_numbers, question_sums):
+        merged_numbers = np.union1d(self.question_numbers, question_numbers).astype(int)
+        merged = [np.zeros(len(merged_numbers)) for _ in range(6)]
+        for numbers, sums in ((self.question_numbers, self.question_sums), (question_numbers, question_sums)):
+            positions = np.searchsorted(merged_numbers, numbers)
+            for target, values in zip(merged, sums):
+                target[positions] += values
+        # שאלה שכל התלמידים שלה הוסרו יוצאת מהרשימה
+        keep = merged[0] > 0
+        self.question_numbers = merged_numbers[keep]
+        self.question_sums = tuple(values[keep] for values in merged)
+
+    @property
+    def students(self) -> set[str]:
+        return set(self.scores)
+
+    def to_dict(self) -> dict:
+        stats = compute_statistics(list(self.scores.values()), bins=self.bins)
+        stats["questions"] = _question_stats_from_sums(self.question_numbers, *self.question_sums)
+        return stats
+
+    def to_state(self) -> dict:
+        return {
+            "bins": self.bins,
+            "scores": self.scores,
+            "question_numbers": self.question_numbers.tolist(),
+            "question_sums": [values.tolist() for values in self.question_sums],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "StatsAccumulator":
+        accumulator = cls(bins=state.get("bins", DEFAULT_BINS))
+        accumulator.scores = {student: float(score) for student, score in state["scores"].items()}
+        accumulator.question_numbers = np.asarray(state["question_numbers"], dtype=int)
+        accumulator.question_sums = tuple(np.asarray(values, dtype=np.float64) for values in state["question_sums"])
+        return accumulator
+
+
+def _score(student: dict) -> float:
+    score = student.get("overall_score")
+    return float(score) if score is not None else float("nan")
+
+
+def _results_sums(results: list[dict]):
+    scores = _as_array([_score(student) for student in results])
+    question_numbers, matrix = grades_matrix(results)
+    return question_numbers, _question_sums(matrix, scores)
+
+
+def summarize_results(results: list[dict], bins: int = DEFAULT_BINS) -> dict:
+    return StatsAccumulator(bins=bins).add_results(results).to_dict()
@@ -0,0 +1,34 @@
+import os
+import json
+import tempfile
+from typing import Any
+
+
+def atomic_write(path: str, data: str | bytes):
+    # כתיבה לקובץ זמני באותה תיקייה ואז החלפה, כך שקורא אף פעם לא רואה קובץ חלקי
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_json(path: str, data: Any, **kwargs):
+    atomic_write(path, json.dumps(data, ensure_ascii=False, **kwargs))
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default